@@ -0,0 +1,421 @@
+from contextlib import redirect_stdout
+from data.data_store import ENGINES
+from data.db import get_pool
+from data.spread_set import STAT_COST
+from functools import partial
+from io import StringIO
+from json import dumps, loads
+from numpy import __version__ as numpy_version
+from os.path import abspath, dirname
+from platform import platform, python_version
+from scan import get_data_store, scan
+from statistics import median
+from subprocess import run
+from sys import argv, executable, exit
+from time import perf_counter
+
+
+# repeatable timings of the scan pipeline on a database, e.g. one
+# written by synth_db.py, which can be saved and compared against a
+# baseline. each benchmark is timed REPEAT times and reported by its
+# fastest run, which is the least sensitive to other load on the
+# machine. startup benchmarks time importing the scanning core in a
+# new interpreter, and the packages it loads are kept as its import
+# footprint.
+
+REPEAT = 5
+TOLERANCE = 0.2     # ratio to the baseline over 1 + TOLERANCE is slower
+MAX_MATCHES = 200   # matches per spread set and stat benchmark
+
+# modules timed by the startup benchmarks, each in a new interpreter,
+# as a worker process or a scanner.py run would import them
+STARTUP_MODULES = ( "scan", "scanner" )
+
+# packages the scanning core should not import, e.g. for plotting
+HEAVY_PACKAGES = ( "matplotlib", "plotly", "dash" )
+
+# where the startup benchmarks run, since scanner.py reads 
+# ./config.json
+ROOT = dirname(abspath(__file__))
+
+# prints the top-level packages importing a module adds
+FOOTPRINT = '''
+import sys
+before = set(sys.modules)
+import {}
+print(" ".join(sorted(set(
+    name.split(".")[0] for name in set(sys.modules) - before
+    if not name.startswith("_")
+))))
+'''
+
+# scans run by the benchmarks, by store type. contract is the
+# database's first product for calendar scans and its second, if any,
+# for sequence scans; data_range is every date in the database.
+BENCH_SCANS = {
+    "calendar": {
+        "name": "bench_calendar",
+        "type": "calendar",
+        "result_limit": None,
+        "legs": [
+            [ "F", "Z", "0", "1", "A" ],
+            [ "+1", "Z", "+0", "1", "B" ]
+        ],
+        "filters": [
+            {
+                "type": "rank",
+                "mode": "abs",
+                "range": [ [ 0.0, 0.3 ], [ 0.7, 1.0 ] ]
+            }
+        ]
+    },
+    "sequence": {
+        "name": "bench_sequence",
+        "type": "sequence",
+        "result_limit": None,
+        "legs": [
+            [ "0", "10", "A" ],
+            [ "+1", "+3", "B" ]
+        ],
+        "filters": [
+            {
+                "type": "rank",
+                "mode": "abs",
+                "range": [ [ 0.0, 0.5 ] ]
+            },
+            {
+                "type": "settle",
+                "mode": "std",
+                "range": [ [ -5, 5 ] ]
+            }
+        ]
+    }
+}
+
+# legs for the iterator benchmarks, by store type: three-legged, so
+# the iterators have more than the scans' matches to enumerate
+ITERATE_LEGS = {
+    "calendar": [
+        [ "F", "Z", "0", "2", "A" ],
+        [ "+0", "Z", "+0", "2", "B" ],
+        [ "+0", "Z", "+0", "2", "A" ]
+    ],
+    "sequence": [
+        [ "0", "40", "A" ],
+        [ "+1", "+12", "B" ],
+        [ "+1", "+12", "A" ]
+    ]
+}
+
+
+# BENCH_SCANS, with each scan's contract and data_range from db
+def get_scan_defs(db):
+    products = [
+        row[0] for row in db.query(
+            "SELECT name FROM metadata GROUP BY name ORDER BY MIN(contract_id);"
+        )
+    ]
+    start, end = next(db.query("SELECT MIN(date), MAX(date) FROM ohlc;"))
+    scan_defs = {}
+
+    for i, ( type, scan_def ) in enumerate(BENCH_SCANS.items()):
+        scan_def = dict(scan_def)
+        scan_def["contract"] = products[min(i, len(products) - 1)]
+        scan_def["data_range"] = [ start, end ]
+        scan_defs[type] = scan_def
+
+    return scan_defs
+
+
+def get_store(db, scan_def, engine = None):
+    data_store = get_data_store(
+        scan_def["type"],
+        scan_def["contract"],
+        scan_def["data_range"],
+        db,
+        None
+    )
+
+    if engine:
+        data_store.set_engine(engine)
+        data_store.init_engine()
+
+    return data_store
+
+
+def get_matches(data_store, scan_def):
+    matches = []
+
+    for match in data_store.get_iterator(scan_def["legs"]):
+        if len(matches) == MAX_MATCHES:
+            break
+
+        matches.append(match)
+
+    return matches
+
+
+# matches the iterator yields
+def iterate(data_store, legs):
+    return sum(1 for _ in data_store.get_iterator(legs))
+
+
+# spread sets a scan would filter, i.e. built and live
+def get_spread_sets(data_store, matches):
+    return [
+        spread_set
+        for _, spread_set in data_store.get_spread_sets(matches)
+        if spread_set and spread_set.get_live()
+    ]
+
+
+def add_stats(spread_sets, stats):
+    for spread_set in spread_sets:
+        spread_set.add_stats(stats)
+
+
+def run_python(code):
+    return run(
+        [ executable, "-c", code ],
+        cwd = ROOT,
+        check = True,
+        capture_output = True,
+        text = True
+    ).stdout
+
+
+# top-level packages, including the module's own, that importing 
+# module loads into a new interpreter
+def get_footprint(module):
+    return run_python(FOOTPRINT.format(module)).split()
+
+
+def execute(db, scan_def, data_store):
+    with redirect_stdout(StringIO()):
+        scan(scan_def, db, None, data_store).execute()
+
+
+# a benchmark's setup returns the callable to time. this one is for
+# benchmarks with nothing to set up.
+def prepared(run, *args):
+    return lambda: partial(run, *args)
+
+
+# fresh spread sets every run, since add_stats() keeps the stats
+# already added. every other stat adds settle first, so settle is
+# added here to time the stat alone.
+def setup_stat(data_store, matches, stat):
+    spread_sets = get_spread_sets(data_store, matches)
+
+    if stat != "settle":
+        add_stats(spread_sets, [ "settle" ])
+
+    return partial(add_stats, spread_sets, [ stat ])
+
+
+# { name: setup }, in the order they are run
+#   - engines: data_store engines to run engine-dependent benchmarks on
+def get_benchmarks(db, engines):
+    # the interpreter alone, to subtract from the imports
+    benchmarks = { "startup:python": prepared(run_python, "pass") }
+
+    for module in STARTUP_MODULES:
+        benchmarks[f"startup:{module}"] = prepared(
+            run_python, f"import {module}"
+        )
+
+    for type, scan_def in get_scan_defs(db).items():
+        data_store = get_store(db, scan_def)
+        matches = get_matches(data_store, scan_def)
+
+        benchmarks[f"load:{type}"] = prepared(get_store, db, scan_def)
+        benchmarks[f"iterate:{type}"] = prepared(
+            iterate, data_store, ITERATE_LEGS[type]
+        )
+
+        for engine in engines:
+            data_store = get_store(db, scan_def, engine)
+            prefix = f"{type}:{engine}"
+
+            benchmarks[f"spread_set:{prefix}"] = prepared(
+                get_spread_sets, data_store, matches
+            )
+
+            for stat in STAT_COST:
+                benchmarks[f"stat:{prefix}:{stat}"] = partial(
+                    setup_stat, data_store, matches, stat
+                )
+
+            benchmarks[f"scan:{prefix}"] = prepared(
+                execute, db, scan_def, data_store
+            )
+
+    return benchmarks
+
+
+# { "min", "median" } seconds over repeat runs
+def time_benchmark(setup, repeat):
+    times = []
+
+    for _ in range(repeat):
+        run = setup()
+        start = perf_counter()
+        run()
+        times.append(perf_counter() - start)
+
+    return { "min": min(times), "median": median(times) }
+
+
+# { "meta", "results": { name: time_benchmark() }, "footprint": 
+# { module: get_footprint() } }
+#   - only: benchmark name prefix, e.g. "stat:", or None for all
+def run_benchmarks(db_path, engines, repeat, only = None):
+    db = get_pool(db_path)
+    results = {}
+
+    for name, setup in get_benchmarks(db, engines).items():
+        if only and not name.startswith(only):
+            continue
+
+        results[name] = time_benchmark(setup, repeat)
+        print_result(name, results[name])
+
+    footprint = {
+        module: get_footprint(module) for module in STARTUP_MODULES
+    }
+    print_footprint(footprint)
+
+    return {
+        "meta": {
+            "db_path": db_path,
+            "engines": engines,
+            "repeat": repeat,
+            "max_matches": MAX_MATCHES,
+            "python": python_version(),
+            "numpy": numpy_version,
+            "platform": platform()
+        },
+        "results": results,
+        "footprint": footprint
+    }
+
+
+def print_result(name, result):
+    print(f"{name:40} {result['min']:10.4f} {result['median']:10.4f}")
+
+
+def print_footprint(footprint):
+    for module, packages in footprint.items():
+        heavy = [ p for p in packages if p in HEAVY_PACKAGES ]
+        print(
+            f"import {module}: {len(packages)} packages" +
+            (f", including {', '.join(heavy)}" if heavy else "")
+        )
+
+
+# { module: [ package, ... ] } imported now but not in baseline, e.g.
+# a plotting library back on the scan import path
+def compare_footprints(baseline, current):
+    if "footprint" not in baseline:
+        return {}
+
+    return {
+        module: [
+            package for package in packages
+            if package not in baseline["footprint"].get(module, [])
+        ]
+        for module, packages in current["footprint"].items()
+    }
+
+
+# { name: [ baseline, current, ratio, status ] } for benchmarks in 
+# both, by their fastest runs
+#   - status: "slower" or "faster" if the ratio is outside TOLERANCE,
+#             else "same"
+def compare(baseline, current, tolerance = TOLERANCE):
+    comparison = {}
+
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+
+        old = baseline["results"][name]["min"]
+        new = result["min"]
+        ratio = new / old if old > 0 else float("inf")
+        status = "same"
+
+        if ratio > 1 + tolerance:
+            status = "slower"
+        elif ratio < 1 / (1 + tolerance):
+            status = "faster"
+
+        comparison[name] = [ old, new, ratio, status ]
+
+    return comparison
+
+
+def print_comparison(comparison):
+    for name, ( old, new, ratio, status ) in comparison.items():
+        print(f"{name:40} {old:10.4f} {new:10.4f} {ratio:6.2f}x  {status}")
+
+
+def get_arg(args, name, default):
+    return args[args.index(name) + 1] if name in args else default
+
+
+# usage: python bench.py DB [--engines ENGINES] [--repeat N] [--only PREFIX]
+#                       [--save PATH] [--compare PATH] [--tolerance X]
+#   - DB:           e.g. from synth_db.py, with a fixed --end so the
+#                   results are comparable from one day to the next
+#   - --engines:    e.g. "reference,fast", default "fast"
+#   - --repeat:     runs per benchmark, default REPEAT
+#   - --only:       runs the benchmarks starting with PREFIX, e.g. 
+#                   "stat:calendar" or "startup"
+#   - --save:       writes the results to PATH, as a baseline
+#   - --compare:    compares the results with the baseline at PATH and
+#                   exits with status 1 if any benchmark is slower.
+#                   also lists packages the imports load that they
+#                   didn't in the baseline.
+#   - --tolerance:  see TOLERANCE
+if __name__ == "__main__":
+    args = argv[1:]
+    engines = get_arg(args, "--engines", "fast").split(",")
+
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine: {engine}")
+
+    print(f"{'benchmark':40} {'min':>10} {'median':>10}")
+
+    results = run_benchmarks(
+        args[0],
+        engines,
+        int(get_arg(args, "--repeat", REPEAT)),
+        get_arg(args, "--only", None)
+    )
+
+    if "--save" in args:
+        with open(get_arg(args, "--save", None), "w") as fd:
+            fd.write(dumps(results, indent = 2))
+
+    if "--compare" in args:
+        with open(get_arg(args, "--compare", None)) as fd:
+            baseline = loads(fd.read())
+
+        comparison = compare(
+            baseline,
+            results,
+            float(get_arg(args, "--tolerance", TOLERANCE))
+        )
+
+        print(f"\nbaseline: {dumps(baseline['meta'])}")
+        print(f"{'benchmark':40} {'baseline':>10} {'current':>10}")
+        print_comparison(comparison)
+
+        for module, packages in \
+            compare_footprints(baseline, results).items():
+            if packages:
+                print(f"import {module} now loads: {' '.join(packages)}")
+
+        if any(row[3] == "slower" for row in comparison.values()):
+            exit(1)
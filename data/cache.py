@@ -0,0 +1,102 @@
+from numpy import load, save
+from os import getpid, listdir, makedirs, replace, rmdir, stat
+from os.path import exists, join
+from shutil import rmtree
+
+
+# on-disk cache of loaded data_store columns:
+#
+#   <path>/<contract>/<start>_<end>/<fingerprint>/<field>.npy
+#
+#   - fingerprint identifies the state of the database file, so
+#     any write to the database invalidates older entries
+#   - columns are returned memory-mapped and read-only
+class data_cache:
+
+
+    def __init__(self, path):
+        self.set_path(path)
+
+
+    def set_path(self, path): self.path = path
+    def get_path(self): return self.path
+
+
+    # database file (and write-ahead log, if any) mtime and size
+    def fingerprint(self, db_file):
+        parts = []
+
+        for file in (db_file, db_file + "-wal"):
+            if exists(file):
+                st = stat(file)
+                parts.append(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+
+        return "_".join(parts)
+
+
+    def get_dir(self, contract, data_range):
+        return join(
+            self.get_path(),
+            contract,
+            f"{data_range[0]}_{data_range[1]}"
+        )
+
+
+    # returns None on a miss
+    def load(self, contract, data_range, fingerprint, fields):
+        if not fingerprint:
+            return None
+
+        entry = join(self.get_dir(contract, data_range), fingerprint)
+
+        try:
+            return [
+                load(join(entry, f"{field}.npy"), mmap_mode = "r")
+                for field in fields
+            ]
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+    # removes every entry of contract, over all data_ranges, written
+    # for another database fingerprint, e.g. the union ranges of
+    # earlier scanner batches
+    def prune(self, contract, fingerprint):
+        contract_dir = join(self.get_path(), contract)
+
+        for range_dir in listdir(contract_dir):
+            parent = join(contract_dir, range_dir)
+
+            for old in listdir(parent):
+                # leave other writers' in-progress entries alone
+                if old != fingerprint and not old.endswith(".tmp"):
+                    rmtree(join(parent, old), ignore_errors = True)
+
+            try:
+                rmdir(parent)
+            except OSError:
+                # not empty
+                pass
+
+
+    # replaces any entries written for older database fingerprints
+    def store(self, contract, data_range, fingerprint, fields, columns):
+        if not fingerprint:
+            return
+
+        parent = self.get_dir(contract, data_range)
+        entry = join(parent, fingerprint)
+        tmp = f"{entry}.{getpid()}.tmp"
+
+        makedirs(tmp, exist_ok = True)
+
+        for field, column in zip(fields, columns):
+            save(join(tmp, f"{field}.npy"), column)
+
+        try:
+            replace(tmp, entry)
+        except OSError:
+            # another process already stored this entry
+            rmtree(tmp, ignore_errors = True)
+
+        self.prune(contract, fingerprint)
@@ -1,5 +1,7 @@
 from enum import IntEnum
+from numpy import concatenate
 
+# column indices into contract.get_rows()
 class contract_row(IntEnum):
     date = 0
     settle = 1
@@ -10,7 +12,7 @@ class contract:
         self.set_id(id)
         self.set_month(month)
         self.set_year(int(year))
-        self.set_rows([])
+        self.set_rows(None)
     
     def set_month(self, month): self.month = month
     def get_month(self): return self.month
@@ -21,11 +23,14 @@ class contract:
     def set_id(self, id): self.id = id
     def get_id(self): return self.id
 
+    # [ dates, settles, days_listed ]
     def set_rows(self, rows): self.rows = rows
     def get_rows(self): return self.rows
 
-    def add_row(self, row):
-        self.get_rows().append(row)
+    def add_rows(self, rows):
+        self.set_rows(
+            [ concatenate((old, new)) for old, new in zip(self.rows, rows) ]
+        )
 
     def __str__(self):
         return self.id
@@ -1,3 +1,5 @@
+from data.match_iterator import match_iterator
+
 MONTH_DOMAIN = { 
     "F": 0, "G": 1, "H": 2, "J": 3, "K": 4, "M": 5,
     "N": 6, "Q": 7, "U": 8, "V": 9, "X": 10, "Z": 11
@@ -7,16 +9,24 @@ YEAR_DOMAIN = (0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
 # side-ranging not implemented; for now A = long, B = short
 SIDE_DOMAIN = ('A', 'B')
 
-class contract_iterator:
-    def __init__(self, legs):
+class contract_iterator(match_iterator):
+    # available: optional { ( m, y ): ... } of leg values that bind to
+    # a listed contract, see contract_store.get_available(). other
+    # values, and every match under them, are skipped.
+    def __init__(self, legs, available = None):
+        self.set_available(available)
         self.set_legs(legs)
 
-    def set_legs(self, legs): self.legs = legs
+    def set_legs(self, legs):
+        self.legs = legs
+        self.set_counts(None)
     def get_legs(self): return self.legs
     def set_its(self, its): self.its = its
     def get_its(self): return self.its
     def set_finished(self, finished): self.finished = finished
     def get_finished(self): return self.finished
+    def set_available(self, available): self.available = available
+    def get_available(self): return self.available
 
     def in_range(self, cur_vals, m_rng, y_rng):
         return  cur_vals["m"] <= m_rng[1] and \
@@ -73,9 +83,40 @@ class contract_iterator:
 
         return True
 
-    def __iter__(self):
-        self.set_finished(False)
+    def is_available(self, it):
+        available = self.get_available()
+        cur = it["current"]
+
+        return available is None or ( cur["m"], cur["y"] ) in available
+
+    # increment_it(), skipping unavailable values
+    def increment_available(self, it):
+        while self.increment_it(it):
+            if self.is_available(it):
+                return True
+
+        return False
+
+    # init_it(), then skips to the first available value
+    def init_available(self, cur, prev):
+        return  self.init_it(cur, prev) and \
+                (self.is_available(cur) or self.increment_available(cur))
 
+    # available ( m, y ) in increment_it() order
+    def get_values(self, it):
+        rng = it["range"]
+        available = self.get_available()
+
+        return [
+            { "m": m, "y": y }
+            for y in range(rng["y"][0], rng["y"][1] + 1)
+            for m in range(rng["m"][0], rng["m"][1] + 1)
+            if available is None or ( m, y ) in available
+        ]
+
+    # [ null leg, leg_0, ..., leg_n ], initialized, or None if
+    # the first match is invalid
+    def init_its(self):
         its = [{
             # null leg, for binding front leg
             "current": { "m": 0, "y": 0 }, 
@@ -94,21 +135,33 @@ class contract_iterator:
         # initialize range and current values
         for i in range(1, len(its)):
             if not self.init_it(its[i], its[i - 1]): 
-                return [ "INVALID SPECIFCATION" ]
+                return None
+
+        return its
+
+    def __iter__(self):
+        self.set_finished(False)
+
+        its = self.init_its()
+
+        if its is None:
+            return [ "INVALID SPECIFCATION" ]
 
         self.set_its(its)
 
+        # the first match has an unavailable leg: move on as if it
+        # had been returned
+        for i in range(1, len(its)):
+            if not self.is_available(its[i]):
+                self.advance(i)
+                break
+
         return self
 
     def __next__(self):
         if self.get_finished(): raise StopIteration
 
         its = self.get_its()
-        i = len(its) - 1
-        j = i
-
-        to_inc = i
-        to_init = None
 
         # properly set from previous iteration or init
         legs = [ 
@@ -116,9 +169,20 @@ class contract_iterator:
             for it in its[1:] 
         ]
 
+        self.advance(len(its) - 1)
+
+        return tuple(legs)
+
+    # moves to the next match by incrementing loop to_inc and 
+    # re-initializing the loops inside it
+    def advance(self, to_inc):
+        its = self.get_its()
+        j = len(its) - 1
+        to_init = None
+
         while (True):
             if to_inc:
-                if(self.increment_it(its[to_inc])):
+                if(self.increment_available(its[to_inc])):
                     to_init = to_inc + 1
                     to_inc = None
                 else:
@@ -132,15 +196,13 @@ class contract_iterator:
                     # loop N incremented, N+1-M successfully initialized
                     break
                 else:
-                    if(self.init_it(its[to_init], its[to_init - 1])):
+                    if(self.init_available(its[to_init], its[to_init - 1])):
                         to_init += 1
                     else:
                         # loop initialized into bad range;
                         # try incrementing previous loop
                         to_inc = to_init - 1
 
-        return tuple(legs)
-
 if __name__=="__main__":
     
     butterfly = [
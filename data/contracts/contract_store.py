@@ -1,14 +1,23 @@
 from data.data_store import data_store, data_row
-from data.contracts.contract import contract
+from data.contracts.contract import contract, contract_row
 from data.contracts.contract_iterator import contract_iterator
 from data.domain import MONTH_I2A, SIDE_MAP
-from data.spread import spread
-from data.spread_set import spread_set
+from data.spread import spread, SIDE_MAP as SIGN_MAP
+from data.spread_set import spread_set, MAX_WINDOW
+from datetime import date
+from functools import reduce
+from numpy import \
+    argsort, concatenate, diff, empty, flatnonzero, full, intersect1d, \
+    isnan, minimum, nan, nonzero, searchsorted, unique, zeros
 
 class contract_store(data_store):
-    def __init__(self, contract, data_range, cursor):
-        super().__init__(contract, data_range, cursor)
+    def __init__(
+        self, contract, data_range, db, cache = None, columns = None
+    ):
+        super().__init__(contract, data_range, db, cache, columns)
         self.set_contracts({})
+        self.set_matrix(None)
+        self.set_available(None)
         self.init_contracts()
         self.init_year_range(data_range)
         self.skipped = 0
@@ -17,6 +26,12 @@ class contract_store(data_store):
     def get_contracts(self): return self.contracts
     def set_year_range(self, year_range): self.year_range = year_range
     def get_year_range(self): return self.year_range
+    def set_matrix(self, matrix): self.matrix = matrix
+    def get_matrix(self): return self.matrix
+    def set_available(self, available): self.available = available
+    def get_available(self): return self.available
+    def set_last_dates(self, last_dates): self.last_dates = last_dates
+    def get_last_dates(self): return self.last_dates
 
     def init_year_range(self, data_range):
         self.set_year_range(
@@ -29,26 +44,74 @@ class contract_store(data_store):
             ]
         )
 
+    def init_engine(self):
+        if self.get_available() is None:
+            self.init_available()
+
+        if self.get_engine() == "fast" and self.get_matrix() is None:
+            self.init_matrix()
+
     def get_iterator(self, legs):
-        return contract_iterator(legs)
+        if self.get_available() is None:
+            self.init_available()
+
+        return contract_iterator(legs, self.get_available())
 
     def init_contracts(self):
+        columns = self.get_columns()
+        self.add_rows(columns, self.group_by_contract(columns))
+
+    # appends to existing contracts, e.g. from data_store.update()
+    def add_rows(self, columns, groups):
         contracts = self.get_contracts()
-        rows = self.get_rows()
 
-        for row in rows:
-            id = row[data_row.month] + row[data_row.year][2:]
-            
-            if id not in contracts:
-                contracts[id] = contract(
-                    id, 
-                    row[data_row.month], 
-                    row[data_row.year]
-                )
+        for id, month, year, idx in groups:
+            rows = [
+                columns[data_row.date][idx],
+                columns[data_row.settle][idx],
+                columns[data_row.days_listed][idx]
+            ]
 
-            contracts[id].add_row(row[data_row.date:])
+            if id not in contracts:
+                contracts[id] = contract(id, month, year)
+                contracts[id].set_rows(rows)
+            else:
+                contracts[id].add_rows(rows)
 
         self.set_contracts(contracts)
+        self.set_matrix(None)
+        self.set_available(None)
+
+    # [ dates, { contract id: column }, settles, days_listed ]
+    #   - dense [ date x contract ] matrices for the fast engine,
+    #     built on first use
+    #   - settles is NaN where a contract was not listed
+    def init_matrix(self):
+        columns = self.get_columns()
+        dates = unique(columns[data_row.date])
+        groups = self.group_by_contract(columns)
+        settles = full((len(dates), len(groups)), nan)
+        days_listed = full((len(dates), len(groups)), nan)
+        ids = {}
+
+        for j, (id, _, _, idx) in enumerate(groups):
+            rows = searchsorted(dates, columns[data_row.date][idx])
+            settles[rows, j] = columns[data_row.settle][idx]
+            days_listed[rows, j] = columns[data_row.days_listed][idx]
+            ids[id] = j
+
+        self.set_matrix([ dates, ids, settles, days_listed ])
+
+    # if data_range was extended, every match can bind another year
+    def update(self, end = None):
+        year_range = self.get_year_range()
+        num_rows = super().update(end)
+        self.init_year_range(self.get_data_range())
+
+        if self.get_year_range() != year_range:
+            self.set_available(None)
+
+        return num_rows
 
     # ((1, 1, "A"), 2020) => ("F21", "+")
     def bind(self, leg, base_year):
@@ -57,7 +120,187 @@ class contract_store(data_store):
             SIDE_MAP[leg[2]]
         )
 
+    # { ( month, year offset ): { base_year, ... } }, the base years in
+    # year_range for which bind() finds a loaded contract, built on
+    # first use
+    #   - e.g. "F21" is ( 0, 1 ) for 2020, ( 0, 0 ) for 2021
+    #   - matches bind()'s id exactly, so "F05" is never bound: 2000
+    #     + 5 binds to "F5"
+    #
+    # also sets { contract id: last traded date ordinal }
+    def init_available(self):
+        available = {}
+        last_dates = {}
+
+        for id, c in self.get_contracts().items():
+            last_dates[id] = int(c.get_rows()[contract_row.date][-1])
+            month = MONTH_I2A.index(id[0])
+            year = int(id[1:])
+
+            for base_year in self.get_year_range():
+                offset = year - base_year % 100
+
+                if offset >= 0 and str(year) == id[1:]:
+                    available.setdefault(( month, offset ), set()).add(
+                        base_year
+                    )
+
+        self.set_available(available)
+        self.set_last_dates(last_dates)
+
+    # base years, ascending, in which every leg of match binds to a
+    # loaded contract
+    def get_base_years(self, match):
+        if self.get_available() is None:
+            self.init_available()
+
+        available = self.get_available()
+
+        return sorted(
+            set.intersection(
+                *( available.get(( leg[0], leg[1] ), set()) for leg in match )
+            )
+        )
+
+    # a spread's last date is at most its legs' earliest last traded
+    # date, so a match can only be live if, for some base year, every
+    # leg traded within MAX_WINDOW days
+    def may_be_live(self, match):
+        base_years = self.get_base_years(match)
+        last_dates = self.get_last_dates()
+        today = date.today().toordinal()
+
+        # later years are likelier to be live
+        for year in reversed(base_years):
+            last = min(last_dates[self.bind(leg, year)[0]] for leg in match)
+
+            if today - last < MAX_WINDOW:
+                return True
+
+        return False
+
+    # the latest row is rows[0], see spread_set.organize(): the 
+    # earliest base year's spread listed on the set's first date. the
+    # set is live if any year's spread was listed within MAX_WINDOW 
+    # days, so only those dates of each leg are compared for it.
+    def get_live_agg_id(self, match):
+        contracts = self.get_contracts()
+        last_dates = self.get_last_dates()
+        cutoff = date.today().toordinal() - MAX_WINDOW + 1
+        live = False
+        first = None
+
+        for year in self.get_base_years(match):
+            bound_matches = [ self.bind(leg, year) for leg in match ]
+            legs = [
+                contracts[bm[0]].get_rows()[contract_row.date]
+                for bm in bound_matches
+            ]
+
+            if  not live and \
+                min(last_dates[bm[0]] for bm in bound_matches) >= cutoff:
+                live = bool(
+                    set.intersection(
+                        *(
+                            set(dates[searchsorted(dates, cutoff):].tolist())
+                            for dates in legs
+                        )
+                    )
+                )
+
+            # a spread's first date is at least its legs' latest first
+            # date, and ties keep the earlier year
+            if first is None or max(dates[0] for dates in legs) < first[0]:
+                listed = reduce(intersect1d, legs)
+
+                if len(listed) > 0 and (first is None or listed[0] < first[0]):
+                    first = (
+                        listed[0],
+                        tuple(bm[1] + bm[0] for bm in bound_matches)
+                    )
+
+        return first[1] if live else None
+
     def get_spread_set(self, match):
+        if self.get_engine() == "fast":
+            return self.get_spread_set_fast(match)
+        else:
+            return self.get_spread_set_reference(match)
+
+    # every year's spread is a signed sum of settle matrix columns,
+    # NaN wherever any leg was not listed
+    def get_spread_set_fast(self, match):
+        if self.get_matrix() is None:
+            self.init_matrix()
+
+        dates, ids, settles, days_listed = self.get_matrix()
+        cols = []
+        agg_ids = []
+
+        for year in self.get_base_years(match):
+            bound_matches = [ self.bind(leg, year) for leg in match ]
+            cols.append([ ids[bm[0]] for bm in bound_matches ])
+            agg_ids.append(tuple(bm[1] + bm[0] for bm in bound_matches))
+
+        if not cols:
+            return None
+
+        # [ date x year ]
+        values = zeros((len(dates), len(cols)))
+        dls = None
+
+        for i in range(len(match)):
+            leg_cols = [ c[i] for c in cols ]
+            sign = SIGN_MAP[SIDE_MAP[match[i][2]]]
+            values += settles[:, leg_cols] * sign
+            dls =   days_listed[:, leg_cols] if dls is None else \
+                    minimum(dls, days_listed[:, leg_cols])
+
+        # listed rows, ordered by year, then date
+        year_idx, date_idx = nonzero(~isnan(values.T))
+
+        if len(year_idx) == 0:
+            return None
+
+        spread_settles = values[date_idx, year_idx]
+        first = flatnonzero(
+            concatenate(([ True ], year_idx[1:] != year_idx[:-1]))
+        )
+        changes = empty(len(spread_settles))
+        changes[1:] = diff(spread_settles)
+        changes[first] = nan
+
+        # spread_set.organize() order: date, then year
+        order = argsort(date_idx, kind = "stable")
+        date_idx = date_idx[order]
+        year_idx = year_idx[order]
+        id_column = empty(len(agg_ids), dtype = object)
+
+        for i in range(len(agg_ids)):
+            id_column[i] = agg_ids[i]
+
+        ss = spread_set(match, self)
+        ss.add_columns(
+            [
+                dates[date_idx],
+                id_column[year_idx],
+                id_column[year_idx],
+                spread_settles[order],
+                changes[order],
+                dls[date_idx, year_idx],
+                None,   # vol
+                None,   # m_tick
+                None,   # beta
+                None,   # r_2
+                None    # rank
+            ],
+            len(first)
+        )
+        ss.organize()
+
+        return ss
+
+    def get_spread_set_reference(self, match):
         contracts = self.get_contracts()
         year_range = self.get_year_range()
         ss = spread_set(match, self)
@@ -1,83 +1,386 @@
+from data.domain import MONTH_I2A
+from data.metrics import scan_metrics
+from datetime import date
 from enum import IntEnum
+from numpy import \
+    arange, argsort, ascontiguousarray, concatenate, diff, dtype, \
+    flatnonzero, fromiter, float64, int8, int16, int32, searchsorted, \
+    split, zeros
 
+# column indices into data_store.get_columns()
+#   - month:        int8 month code, 0 = F, ..., 11 = Z
+#   - year:         int16, e.g. 2021
+#   - date:         int32 day ordinal, see datetime.date.toordinal()
+#   - settle:       float64
+#   - days_listed:  float64
 class data_row(IntEnum):
-    __order__ = "name month year date settle days_listed"
-    name = 0
-    month = 1
-    year = 2
-    date = 3
-    settle = 4
-    days_listed = 5
-    
+    __order__ = "month year date settle days_listed"
+    month = 0
+    year = 1
+    date = 2
+    settle = 3
+    days_listed = 4
+
+# column indices into data_store.get_nearest_contract()
 class nearest_row(IntEnum):
     date = 0
     settle = 1
     change = 2
 
+ROW_DTYPE = dtype(
+    [
+        ("month", int8),
+        ("year", int16),
+        ("date", int32),
+        ("settle", float64),
+        ("days_listed", float64)
+    ]
+)
+
+# julianday("0001-01-01") - date(1, 1, 1).toordinal()
+ORDINAL_OFFSET = 1721424.5
+
+# ROW_DTYPE's fields over ohlc INNER JOIN metadata
+ROW_COLUMNS = f'''
+        instr('FGHJKMNQUVXZ', month) - 1 AS month,
+        CAST(year AS INTEGER) AS year,
+        CAST(julianday(date) - {ORDINAL_OFFSET} AS INTEGER) AS date,
+        settle,
+        julianday(date) - julianday(from_date) AS days_listed
+'''
+
+# ROW_COLUMNS precomputed by schema.py --materialize
+DERIVED_TABLE = "ohlc_dl"
+
+# rows of several contracts, ordered by product (the contract's
+# position in the parameters), then date, year, month
+#   - parameters:   ( contract_0, ..., contract_n, start, end )
+#   - start, end:   "YYYY-MM-DD", or day ordinals if derived
+def rows_query(num_contracts, derived = False):
+    products = ", ".join(f"({i}, ?)" for i in range(num_contracts))
+
+    if derived:
+        source = f'''
+            month, year, date, settle, days_listed
+            FROM {DERIVED_TABLE}
+        '''
+    else:
+        source = f'''
+            {ROW_COLUMNS}
+            FROM ohlc INNER JOIN metadata USING(contract_id)
+        '''
+
+    return f'''
+        WITH products(product, name) AS (VALUES {products})
+        SELECT DISTINCT product, {source}
+        INNER JOIN products USING(name)
+        WHERE date BETWEEN ? AND ?
+        ORDER BY product ASC, date ASC, year ASC, month ASC;
+    '''
+
+QUERY_DTYPE = dtype([ ("product", int16) ] + ROW_DTYPE.descr)
+
+
+# { contract: columns }, in a single query
+#   - start, end: "YYYY-MM-DD", inclusive
+def query_columns(db, contracts, start, end):
+    derived = db.has_table(DERIVED_TABLE)
+
+    if derived:
+        start = date.fromisoformat(start).toordinal()
+        end = date.fromisoformat(end).toordinal()
+
+    rows = fromiter(
+        db.query(
+            rows_query(len(contracts), derived),
+            ( *contracts, start, end )
+        ),
+        QUERY_DTYPE
+    )
+    bounds = searchsorted(rows["product"], arange(len(contracts) + 1))
+
+    return {
+        contract: [
+            ascontiguousarray(rows[field][bounds[i]:bounds[i + 1]])
+            for field in ROW_DTYPE.names
+        ]
+        for i, contract in enumerate(contracts)
+    }
+
+
+# { contract: columns } over one data_range. contracts are read from
+# the cache when the database is unchanged, the rest in one query.
+def load_columns(db, contracts, data_range, cache = None):
+    # taken before the rows are read, so a write racing
+    # the read can only cause a miss on the next load
+    fingerprint = cache.fingerprint(db.get_path()) if cache else None
+    loaded = {}
+    missing = []
+
+    for contract in contracts:
+        columns = None
+
+        if cache:
+            columns = cache.load(
+                contract, data_range, fingerprint, ROW_DTYPE.names
+            )
+
+        if columns:
+            loaded[contract] = columns
+        else:
+            missing.append(contract)
+
+    if missing:
+        queried = query_columns(db, missing, data_range[0], data_range[1])
+
+        if cache:
+            for contract, columns in queried.items():
+                cache.store(
+                    contract, data_range, fingerprint, ROW_DTYPE.names, columns
+                )
+
+        loaded.update(queried)
+
+    return loaded
+
+
+# rows within data_range, without copying
+def slice_columns(columns, data_range):
+    dates = columns[data_row.date]
+    start = searchsorted(
+        dates, date.fromisoformat(data_range[0]).toordinal(), "left"
+    )
+    end = searchsorted(
+        dates, date.fromisoformat(data_range[1]).toordinal(), "right"
+    )
+
+    return [ column[start:end] for column in columns ]
+
+
+# "reference" builds spreads and stats row by row, "fast" uses the
+# array paths. both must produce the same spread sets.
+ENGINES = ( "reference", "fast" )
+DEFAULT_ENGINE = "fast"
+
 class data_store:
-    def __init__(self, contract, range, cursor):
-        self.set_cursor(cursor)
+    # columns: preloaded by load_columns() over a range covering 
+    # data_range, e.g. shared by every scan on a contract in a batch
+    def __init__(self, contract, range, db, cache = None, columns = None):
+        self.set_db(db)
+        self.set_cache(cache)
         self.set_contract(contract)
         self.set_data_range(range)
-        self.init_rows()
+        self.set_engine(DEFAULT_ENGINE)
+        self.set_metrics(scan_metrics())
+        self.init_rows(columns)
 
-    def set_cursor(self, cursor): self.cursor = cursor
-    def get_cursor(self): return self.cursor
+    def set_db(self, db): self.db = db
+    def get_db(self): return self.db
+    def set_cache(self, cache): self.cache = cache
+    def get_cache(self): return self.cache
     def set_contract(self, contract): self.contract = contract
     def get_contract(self): return self.contract
     def set_data_range(self, data_range): self.data_range = data_range
     def get_data_range(self): return self.data_range
-    def set_rows(self, rows): self.rows = rows
-    def get_rows(self): return self.rows
+    def set_columns(self, columns): self.columns = columns
+    def get_columns(self): return self.columns
     def set_nearest_contract(self, contract): self.nearest_contract = contract
     def get_nearest_contract(self): return self.nearest_contract
+    def set_engine(self, engine): self.engine = engine
+    def get_engine(self): return self.engine
+    # where spread sets and the methods below record timings, e.g. 
+    # the running scan's
+    def set_metrics(self, metrics): self.metrics = metrics
+    def get_metrics(self): return self.metrics
 
-    # [ [ date, settle, change ], ... ]
-    def init_nearest_contract(self):
-        rows = self.get_rows()
-        current_date = None
-        nearest_contract = [ 
-            [ 
-                rows[0][data_row.date],
-                rows[0][data_row.settle],
-                None
-            ]
+    # [ ( "F21", "F", 2021, row_indices ), ... ]
+    #   - row_indices are ascending by date
+    def group_by_contract(self, columns):
+        keys =  columns[data_row.year].astype(int32) * 12 + \
+                columns[data_row.month]
+        order = argsort(keys, kind = "stable")
+        groups = []
+
+        for idx in split(order, flatnonzero(diff(keys[order])) + 1):
+            if len(idx) == 0:
+                continue
+
+            year, month = divmod(int(keys[idx[0]]), 12)
+            month = MONTH_I2A[month]
+            groups.append((month + str(year)[2:], month, year, idx))
+
+        return groups
+
+    # [ dates, settles, changes ]
+    #   - prev_settle: nearest settle before columns[0], if any
+    def get_nearest(self, columns, prev_settle = None):
+        dates = columns[data_row.date]
+        settles = columns[data_row.settle]
+
+        # rows are sorted by date, year, month, so the first
+        # row of each date belongs to the nearest contract
+        first = flatnonzero(
+            concatenate(([ True ], dates[1:] != dates[:-1]))
+        )
+        nearest_settles = settles[first]
+        changes = zeros(len(first))
+        changes[1:] = diff(nearest_settles)
+
+        if prev_settle is not None and len(first) > 0:
+            changes[0] = nearest_settles[0] - prev_settle
+
+        return [
+            dates[first],
+            nearest_settles,
+            changes
         ]
 
-        for row in rows:
-            if row[data_row.date] != current_date:
-                nearest_contract.append([
-                    row[data_row.date],
-                    row[data_row.settle],
-                    None
-                ])
-                current_date = row[data_row.date]
-        
-        for i in range(1, len(nearest_contract)):
-            nearest_contract[i][nearest_row.change] = \
-            nearest_contract[i][nearest_row.settle] - \
-            nearest_contract[i - 1][nearest_row.settle]
-
-        self.set_nearest_contract(nearest_contract)
-
-    def init_rows(self):
-        cursor = self.get_cursor()
+    def init_nearest_contract(self):
+        self.set_nearest_contract(self.get_nearest(self.get_columns()))
+
+    # [ months, years, dates, settles, days_listed ]
+    #   - start, end: "YYYY-MM-DD", inclusive
+    def load_rows(self, start, end):
+        contract = self.get_contract()
+
+        return query_columns(self.get_db(), [ contract ], start, end)[contract]
+
+    def get_fingerprint(self):
+        cache = self.get_cache()
+
+        return cache.fingerprint(self.get_db().get_path()) if cache else None
+
+    def store_rows(self, fingerprint):
+        cache = self.get_cache()
+
+        if cache:
+            cache.store(
+                self.get_contract(),
+                self.get_data_range(),
+                fingerprint,
+                ROW_DTYPE.names,
+                self.get_columns()
+            )
+
+    def init_rows(self, columns = None):
         contract = self.get_contract()
         data_range = self.get_data_range()
 
-        rows = cursor.execute(f'''
-            SELECT DISTINCT
-                name,
-                month,
-                year,
-                date,
-                settle,
-                julianday(date) - julianday(from_date) AS days_listed
-            FROM ohlc INNER JOIN metadata USING(contract_id)
-            WHERE name = "{contract}"
-            AND date BETWEEN "{data_range[0]}" AND "{data_range[1]}"
-            ORDER BY date ASC, year ASC, month ASC;
-        ''').fetchall()
-    
-        self.set_rows(rows)
-        self.init_nearest_contract()
\ No newline at end of file
+        if columns is None:
+            columns = load_columns(
+                self.get_db(), [ contract ], data_range, self.get_cache()
+            )[contract]
+        else:
+            columns = slice_columns(columns, data_range)
+
+        self.set_columns(columns)
+        self.init_nearest_contract()
+
+    # yields ( match, spread_set ) for each match; stores may build
+    # several spread sets at once
+    def get_spread_sets(self, matches):
+        for match in matches:
+            yield match, self.get_spread_set(match)
+
+    # False only if no spread of match can be live, i.e. traded
+    # within MAX_WINDOW days, so it can be skipped without building 
+    # its spread set. stores that can't tell return True.
+    def may_be_live(self, match):
+        return True
+
+    # matches, without those may_be_live() rules out
+    def get_live_matches(self, matches):
+        metrics = self.get_metrics()
+
+        for match in matches:
+            with metrics.time("live"):
+                live = self.may_be_live(match)
+
+            if live:
+                yield match
+            else:
+                metrics.count("dead")
+
+    # the agg_id of match's latest row, if its spread set will be live,
+    # without building it. None if not live or unknown.
+    def get_live_agg_id(self, match):
+        return None
+
+    # matches, without those whose get_live_agg_id() an earlier match
+    # already had. scans skip repeated agg_ids after building too, so
+    # this only saves the build; matches without an agg_id pass.
+    def get_unique_matches(self, matches):
+        metrics = self.get_metrics()
+        seen = set()
+
+        for match in matches:
+            with metrics.time("dedup"):
+                agg_id = self.get_live_agg_id(match)
+
+            if agg_id is not None:
+                if agg_id in seen:
+                    metrics.count("duplicate")
+                    continue
+
+                seen.add(agg_id)
+
+            yield match
+
+    # builds what get_spread_set() would otherwise build on first use,
+    # e.g. before forking workers that share this store
+    def init_engine(self):
+        pass
+
+    # called by update() with only the new rows; subclasses extend
+    # their derived structures here
+    #   - groups: group_by_contract(columns)
+    def add_rows(self, columns, groups):
+        pass
+
+    # appends rows newer than the latest loaded date, e.g. after the 
+    # daily settlement. spread sets built before are not updated; 
+    # they are rebuilt from the store when needed, e.g. by 
+    # scan_result.get_data()
+    #   - end:      "YYYY-MM-DD", optionally extends data_range
+    #   - returns:  number of rows added
+    def update(self, end = None):
+        columns = self.get_columns()
+        data_range = self.get_data_range()
+        dates = columns[data_row.date]
+
+        if end:
+            data_range = [ data_range[0], end ]
+            self.set_data_range(data_range)
+
+        if len(dates) > 0:
+            start = date.fromordinal(int(dates[-1]) + 1).isoformat()
+        else:
+            start = data_range[0]
+
+        fingerprint = self.get_fingerprint()
+        new = self.load_rows(start, data_range[1])
+        num_rows = len(new[data_row.date])
+
+        if num_rows == 0:
+            return 0
+
+        nearest = self.get_nearest_contract()
+        prev_settle = None
+
+        if len(nearest[nearest_row.settle]) > 0:
+            prev_settle = nearest[nearest_row.settle][-1]
+
+        self.set_columns(
+            [ concatenate((old, add)) for old, add in zip(columns, new) ]
+        )
+        self.set_nearest_contract(
+            [
+                concatenate((old, add))
+                for old, add in zip(nearest, self.get_nearest(new, prev_settle))
+            ]
+        )
+
+        self.add_rows(new, self.group_by_contract(new))
+        self.store_rows(fingerprint)
+
+        return num_rows
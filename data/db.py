@@ -0,0 +1,162 @@
+from queue import Empty, LifoQueue
+from sqlite3 import connect
+from threading import Lock
+
+POOL_SIZE = 8               # max open connections per database
+MMAP_SIZE = 1 << 30         # bytes of the database file to memory-map
+CACHE_SIZE = -256 * 1024    # page cache per connection, negative = KiB
+FETCH_SIZE = 4096           # rows per fetchmany() when streaming
+
+pools = {}
+pools_lock = Lock()
+
+
+# shared read-only connection pool for one database file
+#   - connections are reused most-recently-released first, so
+#     their page caches stay warm
+#   - sqlite3 keeps a prepared statement cache per connection,
+#     which parameterized queries hit on every reuse
+class db_pool:
+
+
+    def __init__(self, path, size = POOL_SIZE):
+        self.set_path(path)
+        self.set_size(size)
+        self.set_idle(LifoQueue())
+        self.set_opened(0)
+        self.set_tables(None)
+        self.lock = Lock()
+
+
+    def set_path(self, path): self.path = path
+    def get_path(self): return self.path
+    def set_size(self, size): self.size = size
+    def get_size(self): return self.size
+    def set_idle(self, idle): self.idle = idle
+    def get_idle(self): return self.idle
+    def set_opened(self, opened): self.opened = opened
+    def get_opened(self): return self.opened
+    def set_tables(self, tables): self.tables = tables
+    def get_tables(self): return self.tables
+
+
+    def connect(self):
+        connection = connect(
+            f"file:{self.get_path()}?mode=ro",
+            uri = True,
+            check_same_thread = False
+        )
+
+        connection.execute("PRAGMA query_only = 1;")
+        connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+        connection.execute(f"PRAGMA cache_size = {CACHE_SIZE};")
+        connection.execute("PRAGMA temp_store = MEMORY;")
+
+        return connection
+
+
+    # blocks when all connections are in use
+    def acquire(self):
+        idle = self.get_idle()
+
+        try:
+            return idle.get_nowait()
+        except Empty:
+            pass
+
+        with self.lock:
+            opened = self.get_opened()
+
+            if opened < self.get_size():
+                self.set_opened(opened + 1)
+
+                return self.connect()
+
+        return idle.get()
+
+
+    def release(self, connection):
+        self.get_idle().put(connection)
+
+
+    # yields rows as they are read
+    #   - params:   values for the statement's "?" placeholders
+    #   - size:     rows per fetchmany(), or None to fetchall()
+    def query(self, sql, params = (), size = FETCH_SIZE):
+        connection = self.acquire()
+
+        try:
+            cursor = connection.execute(sql, params)
+
+            if size is None:
+                yield from cursor.fetchall()
+            else:
+                rows = cursor.fetchmany(size)
+
+                while rows:
+                    yield from rows
+                    rows = cursor.fetchmany(size)
+
+            cursor.close()
+        finally:
+            self.release(connection)
+
+
+    # read once per pool; schema changes need a new process
+    def has_table(self, name):
+        tables = self.get_tables()
+
+        if tables is None:
+            tables = set(
+                row[0] for row in self.query(
+                    "SELECT name FROM sqlite_master WHERE type = 'table';"
+                )
+            )
+            self.set_tables(tables)
+
+        return name in tables
+
+
+    def close(self):
+        idle = self.get_idle()
+
+        with self.lock:
+            while not idle.empty():
+                idle.get_nowait().close()
+                self.set_opened(self.get_opened() - 1)
+
+
+    # forgets every connection without closing it, e.g. in a forked
+    # process, which must neither use nor close its parent's
+    def reset(self):
+        self.set_idle(LifoQueue())
+        self.set_opened(0)
+        self.lock = Lock()
+
+
+# one pool per database file, shared by all callers in the process
+def get_pool(path):
+    with pools_lock:
+        if path not in pools:
+            pools[path] = db_pool(path)
+
+        return pools[path]
+
+
+# closes every pool's idle connections, e.g. before forking, so that
+# children don't inherit them
+def close_pools():
+    with pools_lock:
+        for pool in pools.values():
+            pool.close()
+
+
+# pool initializer for forked workers: connections still open in the
+# parent, and locks it may have held, are left behind
+def reset_pools():
+    global pools_lock
+
+    pools_lock = Lock()
+
+    for pool in pools.values():
+        pool.reset()
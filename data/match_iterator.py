@@ -0,0 +1,112 @@
+from copy import deepcopy
+
+
+# counting and random access for contract_iterator and terms_iterator.
+# both enumerate nested loops, one per leg, where each leg's range is
+# bound by the previous leg's current value. subclasses provide:
+#
+#   - init_its():           [ null leg, leg_0, ..., leg_n ], with every
+#                           leg initialized, or None if invalid
+#   - init_it(cur, prev):   binds cur's range to prev, False if invalid
+#   - get_values(it):       it's values, in iteration order, as updates
+#                           for it["current"]
+#
+# counts depend only on the legs, so set_legs() must reset them.
+class match_iterator:
+
+    def set_counts(self, counts): self.counts = counts
+    def get_counts(self): return self.counts
+
+
+    # matches completing legs j + 1, ..., n when leg j's current value
+    # is current. memoized, so counting takes one pass per distinct
+    # ( leg, value ) instead of one per match.
+    def count_from(self, its, j, current):
+        if j == len(its) - 1:
+            return 1
+
+        key = ( j, tuple(current.values()) )
+        counts = self.get_counts()
+
+        if key not in counts:
+            it = deepcopy(its[j + 1])
+            num_matches = 0
+
+            if self.init_it(it, { "current": current }):
+                for value in self.get_values(it):
+                    it["current"].update(value)
+                    num_matches += self.count_from(
+                        its, j + 1, dict(it["current"])
+                    )
+
+            counts[key] = num_matches
+
+        return counts[key]
+
+
+    # number of matches iter() would yield
+    def count(self):
+        its = self.init_its()
+
+        if its is None:
+            return 0
+
+        if self.get_counts() is None:
+            self.set_counts({})
+
+        return self.count_from(its, 0, its[0]["current"])
+
+
+    # sets the iteration state so that __next__() returns the k-th
+    # match (from 0) and continues from there
+    #   - returns: False if there are k or fewer matches
+    def seek(self, k):
+        its = self.init_its()
+
+        if its is None:
+            return False
+
+        if self.get_counts() is None:
+            self.set_counts({})
+
+        for j in range(1, len(its)):
+            it = its[j]
+            self.init_it(it, its[j - 1])
+
+            # skip every value with fewer matches below it than remain
+            for value in self.get_values(it):
+                it["current"].update(value)
+                num_matches = self.count_from(its, j, dict(it["current"]))
+
+                if k < num_matches:
+                    break
+
+                k -= num_matches
+            else:
+                return False
+
+        self.set_its(its)
+        self.set_finished(False)
+
+        return True
+
+
+    # matches start, ..., stop - 1 of the full iteration, without
+    # enumerating the ones before start
+    def slice(self, start, stop):
+        if start >= stop or not self.seek(start):
+            return
+
+        for _ in range(stop - start):
+            if self.get_finished():
+                return
+
+            yield self.__next__()
+
+
+    # the i-th of n contiguous parts of the iteration, which differ in
+    # size by at most one match
+    def shard(self, i, n):
+        num_matches = self.count()
+
+        return self.slice(num_matches * i // n, num_matches * (i + 1) // n)
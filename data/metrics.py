@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from time import perf_counter, process_time
+
+
+# wall and cpu seconds per stage, and counters, e.g. for one scan.
+# stages are exclusive: time in a stage timed inside another, e.g.
+# organize inside get_spread_set, only counts towards the inner one,
+# so the stages add up to the time measured.
+class scan_metrics:
+    def __init__(self):
+        self.set_stages({})
+        self.set_counters({})
+        self.set_stack([])
+
+    # { stage: [ wall, cpu, calls ] }
+    def set_stages(self, stages): self.stages = stages
+    def get_stages(self): return self.stages
+    def set_counters(self, counters): self.counters = counters
+    def get_counters(self): return self.counters
+    # [ [ stage, wall, cpu, child_wall, child_cpu ], ... ] being timed
+    def set_stack(self, stack): self.stack = stack
+    def get_stack(self): return self.stack
+
+    def count(self, counter, n = 1):
+        counters = self.get_counters()
+        counters[counter] = counters.get(counter, 0) + n
+
+    def add(self, stage, wall, cpu, calls = 1):
+        totals = self.get_stages().setdefault(stage, [ 0.0, 0.0, 0 ])
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += calls
+
+    def start(self, stage):
+        self.get_stack().append([ stage, perf_counter(), process_time(), 0, 0 ])
+
+    def stop(self):
+        stack = self.get_stack()
+        stage, wall, cpu, child_wall, child_cpu = stack.pop()
+        wall = perf_counter() - wall
+        cpu = process_time() - cpu
+        self.add(stage, wall - child_wall, cpu - child_cpu)
+
+        if stack:
+            stack[-1][3] += wall
+            stack[-1][4] += cpu
+
+    @contextmanager
+    def time(self, stage):
+        self.start(stage)
+
+        try:
+            yield
+        finally:
+            self.stop()
+
+    # items, with the time taken to produce each one added to stage
+    def timed(self, stage, items):
+        it = iter(items)
+
+        while True:
+            self.start(stage)
+
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+
+            yield item
+
+    # adds another get_report(), e.g. from a worker process
+    def merge(self, report):
+        for stage, totals in report["stages"].items():
+            self.add(stage, totals["wall"], totals["cpu"], totals["calls"])
+
+        for counter, n in report["counters"].items():
+            self.count(counter, n)
+
+    # { "stages": { stage: { "wall", "cpu", "calls" } }, "counters" }
+    def get_report(self):
+        return {
+            "stages": {
+                stage: { "wall": wall, "cpu": cpu, "calls": calls }
+                for stage, ( wall, cpu, calls ) in self.get_stages().items()
+            },
+            "counters": dict(self.get_counters())
+        }
+
+
+# Prometheus text exposition of get_report()s
+#   - reports: { scan name: report }
+def prometheus_text(reports):
+    metrics = [
+        ( "scan_stage_wall_seconds", "wall", "wall time per stage" ),
+        ( "scan_stage_cpu_seconds", "cpu", "cpu time per stage" ),
+        ( "scan_stage_calls_total", "calls", "times each stage ran" )
+    ]
+    lines = []
+
+    for name, key, help in metrics:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+
+        for scan, report in reports.items():
+            for stage, totals in report["stages"].items():
+                lines.append(
+                    f'{name}{{scan="{scan}",stage="{stage}"}} {totals[key]}'
+                )
+
+    lines.append("# HELP scan_matches_total matches by outcome")
+    lines.append("# TYPE scan_matches_total counter")
+
+    for scan, report in reports.items():
+        for counter, n in report["counters"].items():
+            lines.append(
+                f'scan_matches_total{{scan="{scan}",counter="{counter}"}} {n}'
+            )
+
+    return "\n".join(lines) + "\n"
@@ -48,10 +48,12 @@ class spread:
             sign = SIDE_MAP[contracts[i][1]]
             contract_rows = contract.get_rows()
             
-            for row in contract_rows:
-                date = row[contract_row.date]
-                settle = row[contract_row.settle] * sign
-                days_listed = row[contract_row.days_listed]
+            for date, settle, days_listed in zip(
+                contract_rows[contract_row.date].tolist(),
+                contract_rows[contract_row.settle].tolist(),
+                contract_rows[contract_row.days_listed].tolist()
+            ):
+                settle *= sign
 
                 try:
                     r = spread_rows[date]
@@ -84,8 +86,9 @@ class spread:
 
     # terms: 
     #   { 
-    #       "id": [ (i, sign), ... ],
-    #       "rows": [ <terms_rows> ]
+    #       "match": [ (i, sign), ... ],
+    #       "rows": [ <terms_row columns> ],
+    #       "offsets": [ <start of each date's curve>, ..., len(rows) ]
     #   }
     def set_rows_by_terms(self, terms):
         term_idx = 0
@@ -93,33 +96,43 @@ class spread:
 
         agg_id = self.get_id()
         max_idx = max(agg_id, key=lambda t: t[term_idx])[term_idx]
+        columns = terms["rows"]
+        offsets = terms["offsets"]
         rows = []
 
-        for term_set in terms["rows"]:
-            if len(term_set) > max_idx:
-                plot_id = []
-                date = term_set[0][terms_row.date]
-                settle = 0
-                dl = maxsize
-
-                for t in agg_id:
-                    term = t[term_idx]
-                    sign = t[sign_idx]
-                    row = term_set[term]
-                    plot_id.append(sign + row[terms_row.contract])
-                    settle += SIDE_MAP[sign] * row[terms_row.settle]
-                    dl = min(maxsize, row[terms_row.days_listed])
-
-                rows.append(
-                    [ 
-                        date,
-                        agg_id,
-                        tuple(plot_id),
-                        settle,
-                        None,
-                        dl
-                    ]
-                )
+        # first row of every date with enough terms listed
+        starts = offsets[:-1][offsets[1:] - offsets[:-1] > max_idx]
+        dates = columns[terms_row.date][starts].tolist()
+        legs = [
+            (
+                t[sign_idx],
+                columns[terms_row.contract][starts + t[term_idx]].tolist(),
+                columns[terms_row.settle][starts + t[term_idx]].tolist(),
+                columns[terms_row.days_listed][starts + t[term_idx]].tolist()
+            )
+            for t in agg_id
+        ]
+
+        for i in range(len(dates)):
+            plot_id = []
+            settle = 0
+            dl = maxsize
+
+            for sign, contracts, settles, days_listed in legs:
+                plot_id.append(sign + contracts[i])
+                settle += SIDE_MAP[sign] * settles[i]
+                dl = min(dl, days_listed[i])
+
+            rows.append(
+                [ 
+                    dates[i],
+                    agg_id,
+                    tuple(plot_id),
+                    settle,
+                    None,
+                    dl
+                ]
+            )
 
         self.set_rows(rows)
         self.set_changes()
@@ -1,10 +1,17 @@
 from data.data_store import nearest_row
-from window_stats import var, avg, cov
-from datetime import datetime
+from group_stats import \
+    ema, group_by, group_mean, group_rank, trailing_mean
+from window_stats import \
+    var, avg, cov, cov_series, running_sums, squares, var_series
+from datetime import date
 from enum import IntEnum
 from math import sqrt
 from operator import itemgetter
 from data.spread import spread_row
+from numpy import \
+    argsort, array, bincount, concatenate, cumsum, empty, flatnonzero, \
+    fromiter, full, int64, isnan, lexsort, maximum, nan, searchsorted, \
+    sign, split, sqrt as npsqrt, zeros
 from statistics import mean, stdev
 
 class spread_set_row(IntEnum):
@@ -40,61 +47,291 @@ EMA_FACTOR = 2 / (EMA_PERIODS + 1)  # smoothing factor for EMA
 MAX_WINDOW = 5                      # maximum days since latest data point for 
                                     # latest spread in set to be tradeable/"live"
 
+# relative cost of adding each stat, so scans can check the cheapest 
+# filters first
+STAT_COST = {
+    "settle": 0,
+    "rank": 1,
+    "m_tick": 2,
+    "vol": 3,
+    "beta": 4,
+    "r_2": 4
+}
+
+# look-behind stats that add_latest_stats() evaluates for the latest 
+# row alone, rather than for every row
+LATEST_STATS = ( "vol", "beta", "r_2" )
+
 
 class spread_set:
 
     def __init__(self, match, data_store):
         self.set_stats({})
+        self.set_latest_stats({})
         self.set_data_store(data_store)
         self.set_id(match)
-        self.set_latest(None)
+        self.set_latest_idx(None)
         self.set_len(0)
         self.set_live(False)
         self.set_rows([])
+        self.set_columns(None)
+        self.set_dl(None)
 
 
     def set_data_store(self, data_store): self.data_store = data_store
     def get_data_store(self): return self.data_store
     def set_id(self, id): self.id = id
     def get_id(self): return self.id
-    def set_latest(self, latest): self.latest = latest
-    def get_latest(self): return self.latest
+    def set_latest_idx(self, idx): self.latest_idx = idx
+    def get_latest_idx(self): return self.latest_idx
     def set_len(self, len): self.len = len
     def get_len(self): return self.len
     def set_live(self, live): self.live = live
     def get_live(self): return self.live
     def set_rows(self, rows): self.rows = rows
-    def get_rows(self): return self.rows
+    def set_columns(self, columns): self.columns = columns
+    def get_columns(self): return self.columns
     def set_stats(self, stats_dict): self.stats = stats_dict
+    def get_stats(self): return self.stats
     def set_stat(self, stat, stat_dict): self.stats[stat] = stat_dict
     def get_stat(self, stat): return self.stats[stat]
+    # { stat: latest row's value }, see add_latest_stats()
+    def set_latest_stats(self, latest_stats): self.latest_stats = latest_stats
+    def get_latest_stats(self): return self.latest_stats
+    # fast engine: group_by(days_listed), kept between add_stats() calls
+    def set_dl(self, dl): self.dl = dl
+    def get_dl(self): return self.dl
+
+
+    # a spread set holds either rows or, from the fast engine, 
+    # columns: one array per spread_set_row, sorted by date, with 
+    # NaN for missing values and None for stats not yet added.
+    # rows are materialized from columns on first use, after which 
+    # the rows are authoritative.
+    def get_rows(self):
+        if self.rows is None:
+            self.set_rows(
+                [ 
+                    list(row) for row in 
+                    zip(*[ self.get_column_list(i) for i in spread_set_row ])
+                ]
+            )
+            self.set_columns(None)
+
+        return self.rows
+
+
+    def get_column_list(self, i):
+        column = self.get_columns()[i]
+
+        if column is None:
+            return [ None ] * len(self.get_columns()[spread_set_row.date])
+        elif column.dtype == object:
+            return list(column)
+        elif column.dtype.kind == "f":
+            return [ x if x == x else None for x in column.tolist() ]
+        else:
+            return column.tolist()
+
+
+    def get_row(self, i):
+        if self.rows is not None:
+            return self.rows[i]
+
+        columns = self.get_columns()
+
+        return [
+            None if column is None or column[i] != column[i] else
+            column[i] if column.dtype == object else
+            column[i].item()
+            for column in columns
+        ]
+
+
+    # rebuilds columns from rows, e.g. for the fast engine's stats 
+    # after get_rows(); the columns become authoritative
+    def init_columns(self):
+        rows = self.rows
+        columns = []
+
+        for i in spread_set_row:
+            column = [ row[i] for row in rows ]
+
+            if i == spread_set_row.date:
+                columns.append(array(column, dtype = int64))
+            elif i in (spread_set_row.agg_id, spread_set_row.plot_id):
+                ids = empty(len(column), dtype = object)
+                ids[:] = column
+                columns.append(ids)
+            elif all(x is None for x in column):
+                columns.append(None)
+            else:
+                columns.append(
+                    array(
+                        [ nan if x is None else x for x in column ],
+                        dtype = float
+                    )
+                )
+
+        self.set_rows(None)
+        self.set_columns(columns)
+
+
+    # row indices of each spread (agg_id), in date order
+    def get_spread_idx(self):
+        codes = {}
+        agg_ids = self.get_columns()[spread_set_row.agg_id]
+        keys = fromiter(
+            (codes.setdefault(id, len(codes)) for id in agg_ids),
+            dtype = int64,
+            count = len(agg_ids)
+        )
+        order = argsort(keys, kind = "stable")
+
+        return split(order, cumsum(bincount(keys))[:-1])
+
+
+    # the latest row, with the stats add_latest_stats() has evaluated
+    # for it alone
+    def get_latest(self):
+        idx = self.get_latest_idx()
+
+        if idx is None:
+            return None
+
+        latest = list(self.get_row(idx))
+
+        for stat, value in self.get_latest_stats().items():
+            latest[spread_set_index[stat]] = value
+
+        return latest
 
 
     #   - assumes more than one spread has been added
     #   - called from data_store after all spreads have been added
     def organize(self):
-        # sort
-        rows = self.get_rows()
-        rows.sort(key = itemgetter(spread_set_row.date))
+        with self.get_data_store().get_metrics().time("organize"):
+            if self.rows is None:
+                # columns are already sorted
+                dates = self.get_columns()[spread_set_row.date]
+                latest_update = int(dates[-1])
+            else:
+                rows = self.get_rows()
+                rows.sort(key = itemgetter(spread_set_row.date))
+                latest_update = rows[len(rows) - 1][spread_set_row.date]
 
-        # latest record: assume rows[0] is latest record in any
-        # tradeable spread
-        latest_update = datetime.strptime(
-            rows[len(rows) - 1][spread_set_row.date], 
-            "%Y-%m-%d"
-        )
-        today = datetime.now()
-        live = (today - latest_update).days < MAX_WINDOW
-        self.set_live(live)
+            # latest record: assume rows[0] is latest record in any
+            # tradeable spread
+            today = date.today().toordinal()
+            live = (today - latest_update) < MAX_WINDOW
+            self.set_live(live)
 
-        if (live):
-            self.set_latest(rows[0])
+            if (live):
+                self.set_latest_idx(0)
 
 
     #   - assumes rows sorted ascending by date in organize()
     #   - vol, beta, and r_2 are look-behind, intra-spread stats
     #   - m_tick is a look-ahead, inter-spread stat
+    #   - stats already added are kept, so stats can be added one
+    #     at a time, e.g. per filter
     def add_stats(self, stats):
+        stats = [ stat for stat in stats if stat not in self.stats ]
+
+        if not stats:
+            return
+
+        data_store = self.get_data_store()
+
+        with data_store.get_metrics().time("stat:" + "+".join(stats)):
+            if data_store.get_engine() == "fast":
+                self.add_stats_fast(stats)
+            else:
+                self.add_stats_reference(stats)
+
+        # the full columns supersede the latest row's values
+        for stat in stats:
+            self.latest_stats.pop(stat, None)
+
+
+    # the latest row's value of each stat, for filters that read only
+    # that, e.g. "abs" filters; the stat's other rows and summary are
+    # left to add_stats(), e.g. for "std" filters or the viewer. with
+    # the fast engine, LATEST_STATS are evaluated over the latest 
+    # row's spread up to that row, or not at all where it has fewer 
+    # than WIN_PERIODS rows before it; other stats, and the reference
+    # engine, fall back to add_stats().
+    def add_latest_stats(self, stats):
+        stats = [ 
+            stat for stat in stats 
+            if stat not in self.stats and stat not in self.latest_stats
+        ]
+        data_store = self.get_data_store()
+
+        if data_store.get_engine() != "fast":
+            self.add_stats(stats)
+
+            return
+
+        self.add_stats([ stat for stat in stats if stat not in LATEST_STATS ])
+        stats = [ stat for stat in stats if stat in LATEST_STATS ]
+
+        if not stats or self.get_latest_idx() is None:
+            return
+
+        with data_store.get_metrics().time("latest:" + "+".join(stats)):
+            if self.rows is not None:
+                self.init_columns()
+
+            for stat, value in self.get_latest_values(stats).items():
+                self.latest_stats[stat] = value
+
+
+    # { stat: value } of LATEST_STATS at the latest row, None where 
+    # add_stats() would leave it None. each stat only looks behind 
+    # within its spread, so the spread's rows after the latest row 
+    # are not evaluated, except for vol's last settle, see get_vol().
+    def get_latest_values(self, stats):
+        columns = self.get_columns()
+        agg_ids = columns[spread_set_row.agg_id]
+        latest_idx = self.get_latest_idx()
+        agg_id = agg_ids[latest_idx]
+        values = { stat: nan for stat in stats }
+        # the latest row's position in its spread
+        i = sum(1 for id in agg_ids[:latest_idx] if id == agg_id)
+
+        if i >= WIN_PERIODS:
+            idx = flatnonzero(
+                fromiter(
+                    (id == agg_id for id in agg_ids), 
+                    dtype = bool, 
+                    count = len(agg_ids)
+                )
+            )
+
+            if "vol" in stats:
+                settles = columns[spread_set_row.settle][idx]
+                values["vol"] = self.get_vol(settles[:i + 1], settles[-1])[i]
+
+            if "beta" in stats or "r_2" in stats:
+                rows, x, y = self.get_returns(idx[:i + 2])
+                at = rows == latest_idx
+
+                # no value where the latest row's return is skipped
+                if at.any():
+                    if "beta" in stats:
+                        values["beta"] = self.get_beta(x, y)[at][0]
+
+                    if "r_2" in stats:
+                        values["r_2"] = self.get_r_2(x, y)[at][0]
+
+        return { 
+            stat: None if value != value else float(value) 
+            for stat, value in values.items()
+        }
+
+
+    def add_stats_reference(self, stats):
         spread_set_rows = self.get_rows()
         nearest = self.get_data_store().get_nearest_contract()
         spreads = {}
@@ -108,9 +345,10 @@ class spread_set:
             dl[x].append(row)
 
         # mandatory: settlement median is used in various places
-        self.add_stat("settle", dl)
-        try: stats.remove("settle")
-        except: pass
+        if "settle" not in self.stats:
+            self.add_stat("settle", dl)
+
+        stats = [ stat for stat in stats if stat != "settle" ]
 
         # group rows by agg_id
         # agg_id allows stats to be computed differently
@@ -122,22 +360,25 @@ class spread_set:
             spreads[agg_id].append(row)
 
         # add stats to rows
-        if "vol" in stats: 
+        if "vol" in stats:
             self.vol(spreads)
 
         if "m_tick" in stats:
             self.m_tick(spreads)
 
-        if "beta" or "r_2" in stats:
+        if "beta" in stats or "r_2" in stats:
             # y:
             #   - spread returns
             #   - { agg_id: [ [ date, return ], ... ]}
             # x:
             #   - front month returns
             #   - { date: return }
-            x = {}
-            for row in nearest:
-                x[row[nearest_row.date]] = row[nearest_row.change]
+            x = dict(
+                zip(
+                    nearest[nearest_row.date].tolist(),
+                    nearest[nearest_row.change].tolist()
+                )
+            )
 
             y = {}
             for id, rows in spreads.items():
@@ -229,6 +470,250 @@ class spread_set:
         )
 
 
+    # add_stats() over columns, with the rows grouped by days_listed 
+    # once for every stat
+    def add_stats_fast(self, stats):
+        if self.rows is not None:
+            self.init_columns()
+
+        columns = self.get_columns()
+
+        if self.get_dl() is None:
+            self.set_dl(
+                group_by(columns[spread_set_row.days_listed].astype(int64))
+            )
+
+        dl = self.get_dl()
+        stats = [ stat for stat in stats if stat != "settle" ]
+
+        # mandatory: settlement median is used in various places
+        if "settle" not in self.stats:
+            self.add_stat_fast("settle", dl)
+        self.add_window_stats(stats)
+
+        if "m_tick" in stats:
+            self.m_tick_fast(dl)
+
+        if "rank" in stats:
+            columns[spread_set_row.rank] = group_rank(
+                columns[spread_set_row.settle], dl[2], len(dl[0])
+            )
+
+        for stat in stats: self.add_stat_fast(stat, dl)
+
+
+    # add_stat() over columns
+    #   - dl: group_by(days_listed)
+    def add_stat_fast(self, stat, dl):
+        keys, first, inverse = dl
+        values = self.get_columns()[spread_set_index[stat]]
+
+        if values is None:
+            values = full(len(inverse), nan)
+
+        vals = values[~isnan(values)]
+
+        # x = days_listed, y = avg value, ordered by y and then by
+        # each days_listed's first row, as sorted() in add_stat()
+        means = group_mean(values, inverse, len(keys))
+        has = flatnonzero(~isnan(means))
+        order = lexsort((first[has], means[has]))
+        x = keys[has][order]
+        y = means[has][order]
+
+        mid = len(y) // 2
+
+        if len(y) == 0:
+            median = nan
+        elif len(y) % 2 == 0:
+            median = (y[mid - 1] + y[mid]) / 2
+        else:
+            median = y[mid]
+
+        # filters only need the summary, so the smoothed rows are 
+        # left to get_stat_rows()
+        self.set_stat(
+            stat,
+            {
+                "rows": None,
+                "series": [ x, y ],
+                "mean": float(vals.mean()) if len(vals) > 0 else nan,
+                "median": float(median),
+                "std": float(vals.std(ddof = 1)) if len(vals) > 1 else nan
+            }
+        )
+
+
+    # [ [ days_listed, avg value ], ... ] for plotting, see add_stat().
+    # with the fast engine, built from the stat's series on first use.
+    def get_stat_rows(self, stat):
+        stat_dict = self.get_stat(stat)
+
+        if stat_dict["rows"] is None:
+            x, y = stat_dict.pop("series")
+
+            # smooth stat rows, except for settlement
+            if stat != "settle":
+                y = ema(y, EMA_FACTOR)
+
+            stat_dict["rows"] = [
+                list(row) for row in zip(x.tolist(), y.tolist())
+            ]
+
+        return stat_dict["rows"]
+
+
+    # m_tick() over columns: one tick per row, except each spread's 
+    # first, averaged per days_listed
+    #   - dl: group_by(days_listed)
+    def m_tick_fast(self, dl):
+        keys, _, inverse = dl
+        columns = self.get_columns()
+        median = self.get_stat("settle")["median"]
+        cur = []
+        prev = []
+
+        for idx in self.get_spread_idx():
+            cur.append(idx[1:])
+            prev.append(idx[:-1])
+
+        cur = concatenate(cur)
+        prev = concatenate(prev)
+        x = columns[spread_set_row.change][cur] * \
+            (median - columns[spread_set_row.settle][prev])
+        ticked = x != 0
+        ticks = full(len(inverse), nan)
+        ticks[cur[ticked]] = sign(x[ticked])
+
+        # moving average over days_listed with any ticks
+        ticks_by_dl = group_mean(ticks, inverse, len(keys))
+        has = flatnonzero(~isnan(ticks_by_dl))
+        m_ticks = full(len(keys), nan)
+        m_ticks[has] = trailing_mean(ticks_by_dl[has], WIN_PERIODS)
+        columns[spread_set_row.m_tick] = m_ticks[inverse]
+
+
+    # vol, beta and r_2 for the fast engine, over each spread's 
+    # columns at once. same values as vol(), beta() and r_2(), see 
+    # get_vol(), get_beta() and get_r_2().
+    def add_window_stats(self, stats):
+        columns = self.get_columns()
+        num_rows = len(columns[spread_set_row.date])
+        spread_idx = self.get_spread_idx()
+
+        if "vol" in stats:
+            vol = full(num_rows, nan)
+
+            for idx in spread_idx:
+                x = columns[spread_set_row.settle][idx]
+                vol[idx] = self.get_vol(x, x[-1])
+
+            columns[spread_set_row.vol] = vol
+
+        if "beta" in stats or "r_2" in stats:
+            beta = full(num_rows, nan)
+            r_2 = full(num_rows, nan)
+
+            for idx in spread_idx:
+                rows, x, y = self.get_returns(idx)
+
+                if "beta" in stats:
+                    beta[rows] = self.get_beta(x, y)
+
+                if "r_2" in stats:
+                    r_2[rows] = self.get_r_2(x, y)
+
+            if "beta" in stats:
+                columns[spread_set_row.beta] = beta
+
+            if "r_2" in stats:
+                columns[spread_set_row.r_2] = r_2
+
+
+    # ( rows, x, y ) for beta() and r_2() of one spread:
+    #   - x: front month returns, y: spread returns, on the dates of
+    #     every spread row but the first. returns without a front 
+    #     month return are skipped.
+    #   - rows: where beta() and r_2() write each return's value, 
+    #     i.e. the row before the one it is the return of
+    #   - idx: the spread's row indices, in date order
+    def get_returns(self, idx):
+        columns = self.get_columns()
+        nearest = self.get_data_store().get_nearest_contract()
+        x_dates = nearest[nearest_row.date]
+        dates = columns[spread_set_row.date][idx[1:]]
+        pos = searchsorted(x_dates, dates)
+        pos[pos == len(x_dates)] = 0
+        found = x_dates[pos] == dates
+
+        return (
+            idx[:-1][found],
+            nearest[nearest_row.change][pos[found]],
+            columns[spread_set_row.change][idx[1:][found]]
+        )
+
+
+    # vol() of one spread's settles, NaN where it writes nothing. its
+    # var is given all of the spread's settles, so it drops the last 
+    # one when the window first fills.
+    #   - x:    the spread's settles, or the first of them
+    #   - last: the spread's last settle
+    def get_vol(self, x, last):
+        sigma = npsqrt(maximum(var_series(x, WIN_PERIODS, last), 0))
+        sigma[:WIN_PERIODS] = nan
+
+        return sigma
+
+
+    # beta() of one spread's returns, NaN where it writes nothing. 
+    # its sums only drop returns after the window has filled, so 
+    # every window also holds the first return; where the divisor 
+    # is 0, beta() raises ZeroDivisionError.
+    def get_beta(self, x, y):
+        x_sq = squares(x)
+        x_0 = zeros(len(x))
+        y_0 = zeros(len(y))
+        x_sq_0 = zeros(len(x))
+
+        if len(x) > WIN_PERIODS + 1:
+            x_0[WIN_PERIODS + 1:] = x[1:len(x) - WIN_PERIODS]
+            y_0[WIN_PERIODS + 1:] = y[1:len(y) - WIN_PERIODS]
+            x_sq_0[WIN_PERIODS + 1:] = x_sq[1:len(x) - WIN_PERIODS]
+
+        XY = running_sums(y * x, y_0 * x_0)
+        X = running_sums(x, x_0)
+        Y = running_sums(y, y_0)
+        X2 = running_sums(x_sq, x_sq_0)
+        d = WIN_PERIODS * X2 - squares(X)
+        b = full(len(x), nan)
+        valid = d != 0
+        b[valid] = (WIN_PERIODS * XY[valid] - X[valid] * Y[valid]) / d[valid]
+        b[:WIN_PERIODS] = nan
+
+        return b
+
+
+    # r_2() of one spread's returns, NaN where it writes nothing. its
+    # x and y grow by one return per call, and the covariance is only
+    # updated where both variances are positive.
+    def get_r_2(self, x, y):
+        last_x = x[WIN_PERIODS - 1] if len(x) >= WIN_PERIODS else 0
+        last_y = y[WIN_PERIODS - 1] if len(y) >= WIN_PERIODS else 0
+        x_sigma = npsqrt(maximum(var_series(x, WIN_PERIODS, last_x), 0))
+        y_sigma = npsqrt(maximum(var_series(y, WIN_PERIODS, last_y), 0))
+        called = (x_sigma > 0) & (y_sigma > 0)
+        cov_xy = cov_series(x, y, WIN_PERIODS, last_x, last_y, called)
+        r_2 = full(len(x), nan)
+        r_2[called] = squares(
+            cov_xy[called] / (x_sigma[called] * y_sigma[called])
+        )
+        r_2[:WIN_PERIODS] = nan
+        # filter outliers
+        r_2[~(r_2 <= 1)] = nan
+
+        return r_2
+
+
     # price volatility
     def vol(self, spreads):
         for _, rows in spreads.items():
@@ -410,6 +895,13 @@ class spread_set:
                 by_settle[0][spread_set_row.rank] = 1
 
 
+    # columns: see get_rows()
+    def add_columns(self, columns, num_spreads):
+        self.set_len(self.get_len() + num_spreads)
+        self.set_rows(None)
+        self.set_columns(columns)
+
+
     # input:    spread_row
     # output:   spread_set_row
     def add_spread(self, spread):
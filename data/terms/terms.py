@@ -1,5 +1,6 @@
 from enum import IntEnum
 
+# column indices into terms_store.get_terms()
 class terms_row(IntEnum):
     date = 0
     contract = 1
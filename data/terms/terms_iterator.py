@@ -1,7 +1,9 @@
+from data.match_iterator import match_iterator
+
 # GE and CL have the most listed contracts, at 120
 TERMS_DOMAIN = [0, 119]
 
-class terms_iterator:
+class terms_iterator(match_iterator):
     # this class is almost entirely copied from 
     # contract_iterator... should probably combine them
     
@@ -9,7 +11,9 @@ class terms_iterator:
         self.set_legs(legs)
 
 
-    def set_legs(self, legs): self.legs = legs
+    def set_legs(self, legs):
+        self.legs = legs
+        self.set_counts(None)
     def get_legs(self): return self.legs
     def set_its(self, its): self.its = its
     def get_its(self): return self.its
@@ -59,9 +63,9 @@ class terms_iterator:
         return tuple(legs)
 
 
-    def __iter__(self):
-        self.set_finished(False)
-
+    # [ null leg, leg_0, ..., leg_n ], initialized, or None if
+    # the first match is invalid
+    def init_its(self):
         its = [{
             # null leg, for binding front leg
             "current": { "term": 0 },
@@ -81,7 +85,18 @@ class terms_iterator:
         # initialize range and current values
         for i in range(1, len(its)):
             if not self.init_it(its[i], its[i - 1]): 
-                return [ "INVALID SPECIFCATION" ]
+                return None
+
+        return its
+
+
+    def __iter__(self):
+        self.set_finished(False)
+
+        its = self.init_its()
+
+        if its is None:
+            return [ "INVALID SPECIFCATION" ]
 
         self.set_its(its)
 
@@ -100,6 +115,13 @@ class terms_iterator:
         return True
 
 
+    # terms in increment_it() order
+    def get_values(self, it):
+        rng = it["range"]
+
+        return [ { "term": term } for term in range(rng[0], rng[1] + 1) ]
+
+
         # - binds the current iterator's range using the previous
         #   iterator's current value, if necessary
         # - sets the current iterator's value
@@ -1,64 +1,299 @@
-
 from data.data_store import data_store, data_row
-from data.domain import SIDE_MAP
+from data.domain import MONTH_I2A, SIDE_MAP
 from data.terms.terms_iterator import terms_iterator
 from data.terms.terms import terms_row
-from data.spread import spread
-from data.spread_set import spread_set
+from data.spread import spread, SIDE_MAP as SIGN_MAP
+from data.spread_set import spread_set, MAX_WINDOW
+from datetime import date
+from itertools import islice
+from numpy import \
+    add, append, arange, array, concatenate, cumsum, diff, empty, \
+    flatnonzero, full, int32, isnan, maximum, nan, repeat, searchsorted, \
+    where
+
+BATCH_SIZE = 512    # sequence matches per weight product
 
 class terms_store(data_store):
 
 
-    def __init__(self, contract, data_range, cursor):
-        super().__init__(contract, data_range, cursor)
-        self.init_terms(self.get_rows())
+    def __init__(
+        self, contract, data_range, db, cache = None, columns = None
+    ):
+        super().__init__(contract, data_range, db, cache, columns)
+        self.set_matrix(None)
+        self.set_last_dates(None)
+        self.init_terms(self.get_columns())
 
 
     def set_terms(self, terms): self.terms = terms
     def get_terms(self): return self.terms
+    def set_offsets(self, offsets): self.offsets = offsets
+    def get_offsets(self): return self.offsets
+    def set_matrix(self, matrix): self.matrix = matrix
+    def get_matrix(self): return self.matrix
+    def set_last_dates(self, last_dates): self.last_dates = last_dates
+    def get_last_dates(self): return self.last_dates
+
+
+    # each date's curve is the run of rows between consecutive
+    # offsets, front contract first:
+    #
+    # terms:    [ dates, contracts, settles, days_listed ]
+    # offsets:  [ 0, n_d1, n_d1 + n_d2, ..., len(rows) ]
+    def init_terms(self, columns):
+        self.set_offsets(self.get_date_offsets(columns[data_row.date]))
+        self.set_terms(
+            [
+                columns[data_row.date],
+                self.get_contract_ids(columns, self.group_by_contract(columns)),
+                columns[data_row.settle],
+                columns[data_row.days_listed]
+            ]
+        )
+
+    def get_date_offsets(self, dates):
+        return flatnonzero(
+            concatenate(([ True ], dates[1:] != dates[:-1], [ True ]))
+        )
+
+    def get_contract_ids(self, columns, groups):
+        ids = empty(len(columns[data_row.date]), dtype = object)
+
+        for id, _, _, idx in groups:
+            ids[idx] = id
+
+        return ids
+
+    # appends new dates' curves, e.g. from data_store.update(), 
+    # which has already appended the new rows to get_columns()
+    def add_rows(self, columns, groups):
+        self.set_matrix(None)
+        self.set_last_dates(None)
+        offsets = self.get_offsets()
+        all_columns = self.get_columns()
+
+        self.set_offsets(
+            concatenate(
+                (
+                    offsets[:-1], 
+                    self.get_date_offsets(columns[data_row.date]) + offsets[-1]
+                )
+            )
+        )
+        self.set_terms(
+            [
+                all_columns[data_row.date],
+                concatenate(
+                    (
+                        self.get_terms()[terms_row.contract],
+                        self.get_contract_ids(columns, groups)
+                    )
+                ),
+                all_columns[data_row.settle],
+                all_columns[data_row.days_listed]
+            ]
+        )
+
+    # [ dates, counts, settles, filled, days_listed, keys ]
+    #   - dense [ date x term ] matrices for the fast engine, built
+    #     on first use
+    #   - counts: number of terms listed on each date
+    #   - settles and days_listed are NaN past the last listed term,
+    #     filled is settles with 0 instead, keys are year * 12 + month
+    #     with -1 instead
+    def init_matrix(self):
+        columns = self.get_columns()
+        offsets = self.get_offsets()
+        counts = diff(offsets)
+        num_terms = int(counts.max()) if len(counts) > 0 else 0
+        shape = (len(counts), num_terms)
 
+        date_idx = repeat(arange(len(counts)), counts)
+        term_idx = arange(len(date_idx)) - repeat(offsets[:-1], counts)
 
-    # [
-    #   [
-    #       [ d1, s_t1, dl_t1 ],
-    #       [ d1, s_t2, dl_t2 ],
-    #       ...
-    #   ],
-    #   [
-    #       [ d2, s_t1, dl_t1 ],
-    #       ...
-    #   ],
-    #   ...
-    # ]
-    def init_terms(self, rows):
-        cur_dt = rows[0][data_row.date]
-        terms_sets = []
-        terms = []
-
-        for i in range(len(rows)):
-            r = rows[i]
-            cur_row = [
-                r[data_row.date],
-                r[data_row.month] + r[data_row.year][2:],
-                r[data_row.settle],
-                r[data_row.days_listed]
+        settles = full(shape, nan)
+        settles[date_idx, term_idx] = columns[data_row.settle]
+        days_listed = full(shape, nan)
+        days_listed[date_idx, term_idx] = columns[data_row.days_listed]
+        keys = full(shape, -1, dtype = int32)
+        keys[date_idx, term_idx] =  columns[data_row.year].astype(int32) * 12 + \
+                                    columns[data_row.month]
+
+        self.set_matrix(
+            [
+                columns[data_row.date][offsets[:-1]],
+                counts,
+                settles,
+                where(isnan(settles), 0, settles),
+                days_listed,
+                keys
             ]
-            if cur_row[terms_row.date] != cur_dt:
-                terms_sets.append(terms)
-                cur_dt = cur_row[terms_row.date]
-                terms = [ cur_row ]
-            else:
-                terms.append(cur_row)
-            
-        if len(terms) > 0:
-            terms_sets.append(terms)
-
-        self.set_terms(terms_sets)
+        )
+
+    # last_dates[term]: the last date ordinal on which term was listed,
+    # built on first use
+    def init_last_dates(self):
+        offsets = self.get_offsets()
+        counts = diff(offsets)
+        dates = self.get_terms()[terms_row.date][offsets[:-1]]
+
+        # listed[i]: most terms listed on date i or later, so the last
+        # date listing term t is the last i with listed[i] > t
+        listed = maximum.accumulate(counts[::-1])[::-1]
+        num_terms = int(listed[0]) if len(listed) > 0 else 0
+        last = searchsorted(-listed, -arange(num_terms), "left") - 1
+
+        self.set_last_dates(dates[last])
+
+    # every leg of a sequence spread is listed through its furthest
+    # term's last date, so this is exact
+    def may_be_live(self, match):
+        if self.get_last_dates() is None:
+            self.init_last_dates()
+
+        last_dates = self.get_last_dates()
+        term = max(t[0] for t in match)
+
+        return  term < len(last_dates) and \
+                date.today().toordinal() - int(last_dates[term]) < MAX_WINDOW
+
+    # a sequence spread set has one spread, identified by its terms
+    def get_live_agg_id(self, match):
+        if not self.may_be_live(match):
+            return None
+
+        return tuple(( term, SIDE_MAP[side] ) for term, side in match)
+
+    def init_engine(self):
+        if self.get_last_dates() is None:
+            self.init_last_dates()
+
+        if self.get_engine() == "fast" and self.get_matrix() is None:
+            self.init_matrix()
 
     def get_iterator(self, legs):
         return terms_iterator(legs)
 
+    # fast engine: evaluates matches BATCH_SIZE at a time
+    def get_spread_sets(self, matches):
+        if self.get_engine() != "fast":
+            yield from super().get_spread_sets(matches)
+            return
+
+        # terms_iterator.__iter__() restarts the scan, so islice()
+        # must not call iter() on it again
+        matches = (match for match in matches)
+        batch = list(islice(matches, BATCH_SIZE))
+
+        while batch:
+            yield from zip(batch, self.get_spread_set_batch(batch))
+            batch = list(islice(matches, BATCH_SIZE))
+
+    # every match is a column of signed weights on terms, so
+    #
+    #   [ date x term ] @ [ term x match ] = [ date x match ]
+    #
+    # gives every match's settles in one product. the weights are
+    # sparse, a handful of legs out of up to num_terms terms, so the 
+    # product is taken as a gather of the legs' columns, scaled by 
+    # their signs and summed per match, rather than over a dense 
+    # weight matrix. each match only keeps dates with all of its terms
+    # listed.
+    def get_spread_set_batch(self, matches):
+        if self.get_matrix() is None:
+            self.init_matrix()
+
+        dates, counts, _, filled, days_listed, keys = self.get_matrix()
+        num_terms = filled.shape[1]
+        spread_sets = []
+
+        if num_terms == 0:
+            return [ None ] * len(matches)
+
+        # one entry per leg, with the legs of each match contiguous. 
+        # unlisted terms are given no weight, their matches no rows.
+        leg_terms = array([ term for match in matches for term, _ in match ])
+        leg_signs = array(
+            [ 
+                SIGN_MAP[SIDE_MAP[side]] 
+                for match in matches for _, side in match 
+            ],
+            dtype = float
+        )
+        unlisted = leg_terms >= num_terms
+        leg_terms[unlisted] = 0
+        leg_signs[unlisted] = 0
+        starts = cumsum([ 0 ] + [ len(match) for match in matches[:-1] ])
+
+        values = add.reduceat(
+            filled[:, leg_terms] * leg_signs, starts, axis = 1
+        )
+
+        for j in range(len(matches)):
+            match = matches[j]
+            terms = [ t[0] for t in match ]
+            valid = flatnonzero(counts > max(terms))
+            num_rows = len(valid)
+
+            if num_rows == 0:
+                spread_sets.append(None)
+                continue
+
+            agg_id = tuple(
+                ( term, SIDE_MAP[side] ) for term, side in match
+            )
+            agg_ids = empty(num_rows, dtype = object)
+            agg_ids.fill(agg_id)
+
+            spread_settles = values[valid, j]
+            changes = empty(num_rows)
+            changes[0] = nan
+            changes[1:] = diff(spread_settles)
+
+            ss = spread_set(match, self)
+            ss.add_columns(
+                [
+                    dates[valid],
+                    agg_ids,
+                    self.get_plot_ids(agg_id, keys[valid[:, None], terms]),
+                    spread_settles,
+                    changes,
+                    days_listed[valid[:, None], terms].min(axis = 1),
+                    None,   # vol
+                    None,   # m_tick
+                    None,   # beta
+                    None,   # r_2
+                    None    # rank
+                ],
+                1
+            )
+            ss.organize()
+            spread_sets.append(ss)
+
+        return spread_sets
+
+    # ( "+F21", "-H21" ) per row, where leg_keys is [ row x leg ]. 
+    # plot ids only change when a leg rolls, so one tuple is built
+    # per run of rows instead of per row.
+    def get_plot_ids(self, agg_id, leg_keys):
+        num_rows = len(leg_keys)
+        runs = flatnonzero(
+            concatenate(([ True ], (leg_keys[1:] != leg_keys[:-1]).any(axis = 1)))
+        )
+        run_ids = empty(len(runs), dtype = object)
+
+        for i, row in enumerate(leg_keys[runs].tolist()):
+            run_ids[i] = tuple(
+                leg[1] + MONTH_I2A[key % 12] + str(key // 12)[2:]
+                for leg, key in zip(agg_id, row)
+            )
+
+        return run_ids[repeat(arange(len(runs)), diff(append(runs, num_rows)))]
+
     def get_spread_set(self, match):
+        if self.get_engine() == "fast":
+            return self.get_spread_set_batch([ match ])[0]
+
         term_idx = 0
         side_idx = 1
         bound = tuple(
@@ -67,6 +302,7 @@ class terms_store(data_store):
         )
         terms = {
             "rows": self.get_terms(),
+            "offsets": self.get_offsets(),
             "match": bound
         }
 
@@ -0,0 +1,525 @@
+from bench import BENCH_SCANS, MAX_MATCHES, get_scan_defs, get_store
+from data.contracts.contract_store import contract_store
+from data.data_store import ROW_DTYPE, nearest_row
+from data.db import get_pool
+from data.domain import MONTH_I2A
+from data.spread_set import STAT_COST, WIN_PERIODS, spread_set_row
+from data.terms.terms_store import terms_store
+from datetime import date, timedelta
+from itertools import islice
+from numpy import array, ascontiguousarray
+from numpy.random import default_rng
+from statistics import StatisticsError
+from synth_db import get_contracts, get_days
+from sys import argv, exit
+from time import perf_counter
+
+
+# runs the reference and fast engines on the same stores and diffs
+# their spread sets and stats, as a check for any new fast path. the
+# edge cases are built in memory, so they run without a database:
+#
+#   - missing_contracts:    years where a leg binds to no contract,
+#                           skipped by the reference engine's KeyError
+#   - partial_legs:         dates on which some legs are not listed
+#   - flat_window:          a stretch where every settle is constant,
+#                           so r_2 and beta see zero-variance windows.
+#                           rows whose windows hold only the stretch
+#                           are also checked against the values the
+#                           reference engine's windows give there, see
+#                           check_flat_rows().
+#   - single_spread:        a one-year data_range, so each spread set
+#                           has one spread to rank
+
+RTOL = 1e-9
+ATOL = 1e-9
+SHOW = 10           # mismatches printed per case
+
+EDGE_YEARS = 3      # years of history in the edge case stores
+EDGE_DEPTH = 24     # months listed before expiry
+EDGE_SEED = 1
+FLAT_DAYS = 45      # trading days of the flat window
+FLAT_END = 60       # trading days from the flat window to the end
+
+FLAT_RTOL = 1e-6    # tolerances of the flat stretch's expected values,
+FLAT_ATOL = 1e-6    # whose running sums cancel
+
+# differences the reference engine is known to have. they are counted,
+# but don't fail the run:
+#   - vol, beta and r_2 at rows whose window overlaps the flat stretch,
+#     where var and cov's running sums cancel, so either engine's 
+#     rounding noise can be most of the value
+#   - statistics.mean() and stdev() raise for stats with too few 
+#     values, e.g. vol on a set shorter than WIN_PERIODS, where the 
+#     fast engine's mean or std is NaN
+WINDOW_STATS = ( "vol", "beta", "r_2" )
+
+
+# legs of BENCH_SCANS' scan of type
+def get_legs(type):
+    return BENCH_SCANS[type]["legs"]
+
+
+# columns as load_columns() returns them, from synth_db.get_contracts()
+def get_columns(contracts):
+    rows = array(
+        [
+            (
+                MONTH_I2A.index(month),
+                year,
+                day.toordinal(),
+                settle,
+                (day - from_date).days
+            )
+            for month, year, from_date, _, days in contracts
+            for day, settle in days
+        ],
+        dtype = ROW_DTYPE
+    )
+    rows.sort(order = [ "date", "year", "month" ])
+
+    return [ ascontiguousarray(rows[field]) for field in ROW_DTYPE.names ]
+
+
+def drop_contracts(contracts):
+    return [ c for i, c in enumerate(contracts) if i % 7 != 3 ]
+
+
+def drop_rows(contracts, rng):
+    return [
+        ( *c[:4], [ row for row in c[4] if rng.random() >= 0.1 ] )
+        for c in contracts
+    ]
+
+
+# ( first day, last day ) of the flat stretch
+def get_flat_range(days):
+    return days[-FLAT_END - FLAT_DAYS], days[-FLAT_END]
+
+
+# each contract's settle is held at its first value in the window
+def flatten(contracts, days):
+    start, end = get_flat_range(days)
+    flattened = []
+
+    for *contract, rows in contracts:
+        flat = [ settle for day, settle in rows if start <= day <= end ]
+        flattened.append(
+            (
+                *contract,
+                [
+                    ( day, flat[0] if start <= day <= end else settle )
+                    for day, settle in rows
+                ]
+            )
+        )
+
+    return flattened
+
+
+# { name: ( data_store, legs, flat ) }, ending yesterday so spread 
+# sets are live
+#   - flat: ordinals of the flat stretch's first and last days, for the
+#           flat_window cases; None for the others
+def get_edge_cases(seed = EDGE_SEED):
+    rng = default_rng(seed)
+    end = date.today() - timedelta(days = 1)
+    days = get_days(end - timedelta(days = round(365.25 * EDGE_YEARS)), end)
+    contracts = get_contracts(rng, days, EDGE_DEPTH)
+    data_range = [ days[0].isoformat(), end.isoformat() ]
+    last_year = [ date(end.year, 1, 1).isoformat(), end.isoformat() ]
+    partial = get_columns(drop_rows(contracts, rng))
+    flat = get_columns(flatten(contracts, days))
+    flat_range = tuple(day.toordinal() for day in get_flat_range(days))
+
+    return {
+        "missing_contracts": (
+            contract_store(
+                "EDGE", data_range, None, None,
+                get_columns(drop_contracts(contracts))
+            ),
+            get_legs("calendar"),
+            None
+        ),
+        "partial_legs:calendar": (
+            contract_store("EDGE", data_range, None, None, partial),
+            get_legs("calendar"),
+            None
+        ),
+        "partial_legs:sequence": (
+            terms_store("EDGE", data_range, None, None, partial),
+            get_legs("sequence"),
+            None
+        ),
+        "flat_window:calendar": (
+            contract_store("EDGE", data_range, None, None, flat),
+            get_legs("calendar"),
+            flat_range
+        ),
+        "flat_window:sequence": (
+            terms_store("EDGE", data_range, None, None, flat),
+            get_legs("sequence"),
+            flat_range
+        ),
+        "single_spread": (
+            contract_store(
+                "EDGE", last_year, None, None, get_columns(contracts)
+            ),
+            get_legs("calendar"),
+            None
+        )
+    }
+
+
+# { name: ( data_store, legs, None ) } for BENCH_SCANS on db
+def get_db_cases(db_path):
+    db = get_pool(db_path)
+
+    return {
+        f"db:{type}": ( get_store(db, scan_def), scan_def["legs"], None )
+        for type, scan_def in get_scan_defs(db).items()
+    }
+
+
+# [ [ row index, ... ], ... ]: each spread's rows, in date order
+def get_spreads(rows):
+    spreads = {}
+
+    for i, row in enumerate(rows):
+        spreads.setdefault(row[spread_set_row.agg_id], []).append(i)
+
+    return list(spreads.values())
+
+
+# indices of the rows whose window overlaps the flat stretch. row p's
+# window is its spread's rows p - WIN_PERIODS to p + 1, since beta and
+# r_2 write each return's value to the row before it.
+#   - flat: see get_edge_cases()
+def get_flat_rows(rows, flat):
+    start, end = flat
+    flat_rows = set()
+
+    for spread in get_spreads(rows):
+        dates = [ rows[i][spread_set_row.date] for i in spread ]
+
+        for p, i in enumerate(spread):
+            window = dates[max(p - WIN_PERIODS, 0):p + 2]
+
+            if any(start <= day <= end for day in window):
+                flat_rows.add(i)
+
+    return flat_rows
+
+
+# [ ( field, where, expected, value ), ... ] for rows whose window holds
+# only the flat stretch's settles or spread returns, where the 
+# reference engine's windows give:
+#   - vol:  var drops the spread's last settle, L, when its window 
+#           first fills, and never adds it back, so with W settles of
+#           c the variance is L * (2c - L * (1 + 1/W)) / W; vol is its
+#           root where it is positive, else 0
+#   - beta: its sums never drop the spread's first return, ( x_0, y_0 ),
+#           so with W spread returns of 0 beta is y_0 * (W x_0 - X) / 
+#           (W X2 - X^2), where X and X2 sum x_0 and the window's front
+#           month returns, and their squares. front month returns are
+#           rarely flat, since the front month rolls.
+#   - r_2:  var drops the W-th return when its window first fills, so
+#           with W spread returns of 0 the spread's variance is negative
+#           and r_2 has no value, unless the W-th return is 0 too and 
+#           the variance is only rounding noise
+# spreads with a return that has no front month return are skipped, 
+# since beta() and r_2() index those differently. sequence spreads roll
+# to other contracts more often than every window, so only calendar 
+# spreads have such rows.
+#   - nearest: { date: front month return }
+def check_flat_rows(rows, stats, nearest, rtol = FLAT_RTOL, atol = FLAT_ATOL):
+    mismatches = []
+    w = WIN_PERIODS
+
+    for spread in get_spreads(rows):
+        settles = [ rows[i][spread_set_row.settle] for i in spread ]
+        dates = [ rows[i][spread_set_row.date] for i in spread ]
+        y = [ rows[i][spread_set_row.change] for i in spread[1:] ]
+        x = [ nearest.get(day) for day in dates[1:] ]
+        last = settles[-1]
+
+        for p, i in enumerate(spread):
+            if "vol" in stats and p >= w and len(set(settles[p - w:p + 1])) == 1:
+                c = settles[p]
+                var = last * (2 * c - last * (1 + 1 / w)) / w
+                vol = rows[i][spread_set_row.vol]
+
+                if not is_close(max(var, 0) ** 0.5, vol, rtol, atol):
+                    mismatches.append(( "vol", f"row {i}", max(var, 0) ** 0.5, vol ))
+
+            # returns 0, ..., p of the spread are in row p's windows
+            if None in x[:p + 1] or p < w or p >= len(y) or \
+               any(y[p - w + 1:p + 1]):
+                continue
+
+            if "beta" in stats:
+                window = [ x[0] ] + x[p - w + 1:p + 1]
+                X = sum(window)
+                d = w * sum(v * v for v in window) - X * X
+                beta = rows[i][spread_set_row.beta]
+
+                if d != 0 and not is_close(y[0] * (w * x[0] - X) / d, beta, rtol, atol):
+                    mismatches.append(
+                        ( "beta", f"row {i}", y[0] * (w * x[0] - X) / d, beta )
+                    )
+
+            if "r_2" in stats and y[w - 1] != 0:
+                r_2 = rows[i][spread_set_row.r_2]
+
+                if r_2 is not None:
+                    mismatches.append(( "r_2", f"row {i}", None, r_2 ))
+
+    return mismatches
+
+
+def is_close(a, b, rtol, atol):
+    if a is None or b is None:
+        return a is None and b is None
+
+    if isinstance(a, float) or isinstance(b, float):
+        # both NaN, e.g. stat summaries of a stat with no values
+        if a != a or b != b:
+            return a != a and b != b
+
+        return abs(a - b) <= atol + rtol * abs(a)
+
+    return a == b
+
+
+# [ [ ( spread_set, errors ) or None, ... ], build seconds, stats
+# seconds ]
+#   - spread sets are None unless built and live; only live sets
+#     get stats, as in a scan
+#   - stats are added one at a time, as scans add them per filter,
+#     so one that raises doesn't hide the rest
+#   - errors: { stat: exception } for the stats that raised
+def run_engine(data_store, engine, matches, stats):
+    data_store.set_engine(engine)
+    data_store.init_engine()
+
+    start = perf_counter()
+    built = [
+        ( spread_set, {} ) if spread_set and spread_set.get_live() else None
+        for _, spread_set in data_store.get_spread_sets(matches)
+    ]
+    end = perf_counter()
+
+    for spread_set, errors in filter(None, built):
+        for stat in stats:
+            try:
+                spread_set.add_stats([ stat ])
+            except Exception as e:
+                errors[stat] = e
+
+    return [ built, end - start, perf_counter() - end ]
+
+
+# ( mismatches, known ), each [ ( field, where, reference value, fast
+# value ), ... ], for one match. known are the mismatches listed in 
+# WINDOW_STATS' comment.
+#   - field:    a spread_set_row or stat name, "live", "rows" or 
+#               "error"
+#   - stat rows are ordered by value, so values that are equal but for
+#     rounding can come in either order: their days_listed are 
+#     compared as sets, their values by position
+#   - flat:     see get_edge_cases()
+def diff_spread_sets(reference, fast, stats, rtol, atol, flat = None):
+    if reference is None or fast is None:
+        return ( [], [] ) if reference is fast else ( [
+            ( "live", "live", reference is not None, fast is not None )
+        ], [] )
+
+    reference, reference_errors = reference
+    fast, fast_errors = fast
+    mismatches = []
+    known = []
+    reference_rows = reference.get_rows()
+    fast_rows = fast.get_rows()
+
+    if len(reference_rows) != len(fast_rows):
+        return [ ( "rows", "rows", len(reference_rows), len(fast_rows) ) ], []
+
+    flat_rows = get_flat_rows(reference_rows, flat) if flat else set()
+
+    for i, ( a, b ) in enumerate(zip(reference_rows, fast_rows)):
+        for column in spread_set_row:
+            if not is_close(a[column], b[column], rtol, atol):
+                (
+                    known if column.name in WINDOW_STATS and i in flat_rows
+                    else mismatches
+                ).append(( column.name, f"row {i}", a[column], b[column] ))
+
+    for stat in [ "settle" ] + [ s for s in stats if s != "settle" ]:
+        if stat in reference_errors or stat in fast_errors:
+            a = reference_errors.get(stat)
+            b = fast_errors.get(stat)
+
+            if type(a) == type(b):
+                continue
+            elif isinstance(a, StatisticsError) and b is None and any(
+                fast.get_stat(stat)[key] != fast.get_stat(stat)[key]
+                for key in ( "mean", "std" )
+            ):
+                known.append(( "error", stat, repr(a), "NaN" ))
+            else:
+                mismatches.append(( "error", stat, repr(a), repr(b) ))
+
+            continue
+
+        a = reference.get_stat(stat)
+        b = fast.get_stat(stat)
+
+        for key in ( "mean", "median", "std" ):
+            if not is_close(float(a[key]), float(b[key]), rtol, atol):
+                mismatches.append(( stat, key, a[key], b[key] ))
+
+        a = reference.get_stat_rows(stat)
+        b = fast.get_stat_rows(stat)
+
+        if len(a) != len(b):
+            mismatches.append(( stat, "stat rows", len(a), len(b) ))
+            continue
+
+        if sorted(p[0] for p in a) != sorted(q[0] for q in b):
+            mismatches.append(( stat, "stat row days_listed", None, None ))
+
+        for j, ( p, q ) in enumerate(zip(a, b)):
+            if not is_close(p[1], q[1], rtol, atol):
+                mismatches.append(( stat, f"stat row {j}", p, q ))
+
+    return mismatches, known
+
+
+# { "matches", "live", "mismatches", "known", "times" }
+#   - mismatches:   [ ( match, field, where, reference, fast ), ... ],
+#                   including, for flat cases, each engine's rows that
+#                   don't have check_flat_rows()' values, as ( match, 
+#                   field, "<engine> <where>", expected, value )
+#   - known:        the mismatches listed in WINDOW_STATS' comment, 
+#                   which are not in mismatches
+#   - times:        { engine: [ build seconds, stats seconds ] }
+#   - limit:        matches to diff, from the start of the iteration
+#   - flat:         see get_edge_cases()
+def diff_engines(
+    data_store, legs, stats, rtol, atol, limit = None, flat = None
+):
+    matches = list(islice(data_store.get_iterator(legs), limit))
+    reference, *reference_times = run_engine(
+        data_store, "reference", matches, stats
+    )
+    fast, *fast_times = run_engine(data_store, "fast", matches, stats)
+    report = {
+        "matches": len(matches),
+        "live": sum(1 for spread_set in reference if spread_set),
+        "mismatches": [],
+        "known": [],
+        "times": { "reference": reference_times, "fast": fast_times }
+    }
+
+    for match, a, b in zip(matches, reference, fast):
+        mismatches, known = diff_spread_sets(a, b, stats, rtol, atol, flat)
+        report["mismatches"].extend(( match, *m ) for m in mismatches)
+        report["known"].extend(( match, *m ) for m in known)
+
+    if flat:
+        nearest = data_store.get_nearest_contract()
+        nearest = dict(
+            zip(
+                nearest[nearest_row.date].tolist(),
+                nearest[nearest_row.change].tolist()
+            )
+        )
+
+        for engine, built in ( ( "reference", reference ), ( "fast", fast ) ):
+            for match, spread_set in zip(matches, built):
+                if not spread_set or spread_set[1]:
+                    continue
+
+                for field, where, expected, value in check_flat_rows(
+                    spread_set[0].get_rows(), stats, nearest
+                ):
+                    report["mismatches"].append(
+                        ( match, field, f"{engine} {where}", expected, value )
+                    )
+
+    return report
+
+
+def print_header():
+    print(
+        f"{'case':24} {'matches':>8} {'live':>6} {'diffs':>6} {'known':>6} "
+        f"{'ref build':>10} {'fast build':>10} {'speedup':>8} "
+        f"{'ref stats':>10} {'fast stats':>10} {'speedup':>8}"
+    )
+
+
+def print_report(name, report, show = SHOW):
+    reference = report["times"]["reference"]
+    fast = report["times"]["fast"]
+    speedups = [
+        a / b if b > 0 else float("inf") for a, b in zip(reference, fast)
+    ]
+
+    print(
+        f"{name:24} {report['matches']:8} {report['live']:6} "
+        f"{len(report['mismatches']):6} {len(report['known']):6} "
+        f"{reference[0]:10.4f} {fast[0]:10.4f} {speedups[0]:7.1f}x "
+        f"{reference[1]:10.4f} {fast[1]:10.4f} {speedups[1]:7.1f}x"
+    )
+
+    for match, field, where, a, b in report["mismatches"][:show]:
+        print(f"    {match} {field} {where}: {a}, {b}")
+
+
+def get_arg(args, name, default):
+    return args[args.index(name) + 1] if name in args else default
+
+
+# usage: python engine_diff.py [DB] [--stats STATS] [--rtol X] [--atol X]
+#                              [--limit N] [--show N]
+#   - DB:       also diffs BENCH_SCANS on DB, e.g. from synth_db.py
+#   - --stats:  e.g. "rank,r_2", default every stat in STAT_COST
+#   - --rtol, --atol:
+#               floats match if |reference - fast| <= atol + rtol *
+#               |reference|. NaN and None only match themselves.
+#   - --limit:  matches per DB case, default bench.MAX_MATCHES; the
+#               reference engine is slow
+#   - --show:   mismatches printed per case, default SHOW
+# prints each mismatch as reference, fast values, or as expected, 
+# actual values for check_flat_rows(). exits with status 1 if any case
+# has a mismatch not listed in WINDOW_STATS' comment.
+if __name__ == "__main__":
+    args = argv[1:]
+    stats = get_arg(args, "--stats", ",".join(STAT_COST)).split(",")
+    rtol = float(get_arg(args, "--rtol", RTOL))
+    atol = float(get_arg(args, "--atol", ATOL))
+    limit = int(get_arg(args, "--limit", MAX_MATCHES))
+    show = int(get_arg(args, "--show", SHOW))
+    cases = get_edge_cases()
+
+    if args and not args[0].startswith("--"):
+        cases.update(get_db_cases(args[0]))
+
+    print_header()
+    num_mismatches = 0
+
+    for name, ( data_store, legs, flat ) in cases.items():
+        report = diff_engines(
+            data_store,
+            legs,
+            stats,
+            rtol,
+            atol,
+            limit if name.startswith("db:") else None,
+            flat
+        )
+        num_mismatches += len(report["mismatches"])
+        print_report(name, report, show)
+
+    if num_mismatches:
+        exit(1)
@@ -0,0 +1,84 @@
+from numpy import \
+    arange, argsort, bincount, concatenate, cumsum, empty, errstate, \
+    full, int64, isnan, lexsort, nan, where
+
+EMA_BLOCK = 32      # values per closed-form step in ema()
+
+
+# rows grouped by an integer key, e.g. days_listed:
+#   [ keys, first, inverse ]
+#   - keys:     each group's key, ascending
+#   - first:    each group's first row index
+#   - inverse:  each row's group index
+def group_by(keys):
+    order = argsort(keys, kind = "stable")
+    sorted_keys = keys[order]
+    starts = concatenate(([ True ], sorted_keys[1:] != sorted_keys[:-1]))
+    inverse = empty(len(keys), dtype = int64)
+    inverse[order] = cumsum(starts) - 1
+
+    return [ sorted_keys[starts], order[starts], inverse ]
+
+
+# per group mean, skipping NaN; NaN for groups without values
+def group_mean(values, inverse, num_groups):
+    valid = ~isnan(values)
+    counts = bincount(inverse[valid], minlength = num_groups)
+    sums = bincount(
+        inverse[valid], weights = values[valid], minlength = num_groups
+    )
+
+    with errstate(divide = "ignore", invalid = "ignore"):
+        return sums / counts
+
+
+# 0 = lowest value in the row's group, 1 = highest, ties in row
+# order. single-row groups are 1.
+def group_rank(values, inverse, num_groups):
+    order = lexsort((values, inverse))
+    counts = bincount(inverse, minlength = num_groups)
+    starts = cumsum(counts) - counts
+    groups = inverse[order]
+    pos = arange(len(values)) - starts[groups]
+    last = counts[groups] - 1
+    ranks = empty(len(values))
+
+    with errstate(divide = "ignore", invalid = "ignore"):
+        ranks[order] = where(last > 0, pos / last, 1)
+
+    return ranks
+
+
+# moving average of the win_len values before each, NaN for the
+# first win_len
+def trailing_mean(x, win_len):
+    out = full(len(x), nan)
+    sums = concatenate(([ 0 ], cumsum(x)))
+    out[win_len:] = (sums[win_len:-1] - sums[:-win_len - 1]) / win_len
+
+    return out
+
+
+# y[0] = x[0], y[i] = y[i - 1] * (1 - factor) + x[i] * factor
+#   - evaluated EMA_BLOCK values at a time, in closed form:
+#     y[k] = d^(k + 1) * y[-1] + factor * d^k * sum(x[j] / d^j, j <= k)
+#     where d = 1 - factor and k, j count from the block's start
+def ema(x, factor):
+    y = empty(len(x))
+
+    if len(x) == 0:
+        return y
+
+    d = 1 - factor
+    powers = d ** arange(EMA_BLOCK + 1)
+    prev = y[0] = x[0]
+
+    for start in range(1, len(x), EMA_BLOCK):
+        block = x[start:start + EMA_BLOCK]
+        n = len(block)
+        y_block =   powers[1:n + 1] * prev + \
+                    factor * powers[:n] * cumsum(block / powers[:n])
+        y[start:start + n] = y_block
+        prev = y_block[-1]
+
+    return y
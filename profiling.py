@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from os import environ, makedirs
+from os.path import join
+from re import sub
+
+# profilers by name, as in SCAN_PROFILE="cpu,mem":
+#   - cpu:  cProfile, written to <dir>/<scan name>.prof
+#   - mem:  tracemalloc, peak memory and the top allocation sites
+#           written to <dir>/<scan name>.mem.txt
+PROFILE_MODES = ( "cpu", "mem" )
+PROFILE_DIR = "./profiles"
+PROFILE_TOP = 20    # allocation sites per memory summary
+
+# { "modes", "dir", "top" }, or None when profiling is off
+options = None
+
+def set_options(opts):
+    global options
+    options = opts
+
+def get_options(): return options
+
+
+#   - modes: e.g. "cpu,mem", empty for None
+def make_options(modes, dir = PROFILE_DIR, top = PROFILE_TOP):
+    modes = [ mode for mode in modes.split(",") if mode ]
+
+    for mode in modes:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"unknown profile mode: {mode}")
+
+    return { "modes": modes, "dir": dir, "top": top } if modes else None
+
+
+# from SCAN_PROFILE, SCAN_PROFILE_DIR and SCAN_PROFILE_TOP
+def get_env_options():
+    return make_options(
+        environ.get("SCAN_PROFILE", ""),
+        environ.get("SCAN_PROFILE_DIR", PROFILE_DIR),
+        int(environ.get("SCAN_PROFILE_TOP", PROFILE_TOP))
+    )
+
+
+def write_memory_summary(path, snapshot, peak, top):
+    with open(path, "w") as fd:
+        fd.write(f"peak: {peak / 2 ** 20:.1f} MiB\n")
+        fd.write(f"top {top} allocation sites:\n")
+
+        for stat in snapshot.statistics("lineno")[:top]:
+            fd.write(f"  {stat}\n")
+
+
+# profiles the block with the profilers in get_options(), if any.
+# the profilers are only imported when enabled, so this costs nothing
+# when profiling is off.
+#   - name: e.g. the scan's name, for the output files
+@contextmanager
+def profiled(name):
+    opts = get_options()
+
+    if not opts:
+        yield
+        return
+
+    from cProfile import Profile
+    import tracemalloc
+
+    modes = opts["modes"]
+    path = join(opts["dir"], sub(r"[^\w.-]", "_", name))
+    profile = Profile() if "cpu" in modes else None
+    # e.g. profiled() nested in a block that is already tracing
+    trace = "mem" in modes and not tracemalloc.is_tracing()
+
+    makedirs(opts["dir"], exist_ok = True)
+
+    if trace:
+        tracemalloc.start()
+
+    if "mem" in modes:
+        tracemalloc.reset_peak()
+
+    if profile:
+        profile.enable()
+
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(path + ".prof")
+
+        if "mem" in modes:
+            _, peak = tracemalloc.get_traced_memory()
+            write_memory_summary(
+                path + ".mem.txt", tracemalloc.take_snapshot(), peak, opts["top"]
+            )
+
+        if trace:
+            tracemalloc.stop()
@@ -1,11 +1,157 @@
 from data.contracts.contract_store import contract_store
+from data.db import close_pools, reset_pools
+from data.metrics import scan_metrics
 from data.terms.terms_store import terms_store
 from data.spread_set import spread_set_index
 from data.spread_set import spread_set_row
+from data.spread_set import STAT_COST
 from datetime import datetime
+from heapq import heappush, heapreplace
+
+CHUNK_SIZE = 256    # matches per task when a scan uses several workers
+
+# scores for ranked scans, higher is better:
+#   - std:      distance of ranking["stat"]'s latest value from its 
+#               median, in standard deviations
+#   - margin:   for each filter, how far inside its passing range the
+#               latest value is, as a fraction of the range's width, 
+#               summed over filters
+# values are the best possible score, if any, given the filters
+SCORE_BOUNDS = {
+    "std": lambda filters: None,
+    "margin": lambda filters: 0.5 * len(filters)
+}
+
+# see scan.get_metrics()
+SCAN_COUNTERS = ( "enumerated", "no_spreads", "dead", "duplicate", "passed" )
+
+# stat summaries kept by scan_result, i.e. without the plot rows
+STAT_SUMMARY = ( "mean", "median", "std" )
+
+# the scan being executed by a worker process. set before the pool 
+# is forked, so workers share the scan and its loaded store instead 
+# of pickling them.
+worker_scan = None
+
+# columns: see data_store.__init__
+def get_data_store(type, contract, data_range, db, cache, columns = None):
+    data_store = None
+
+    if type == "calendar":
+        data_store = contract_store(contract, data_range, db, cache, columns)
+    elif type == "sequence":
+        data_store = terms_store(contract, data_range, db, cache, columns)
+
+    return data_store
+
+
+# [ checked, num_built, report ]
+#   - checked:      ( match, agg_id, result ) for every live spread set
+#                   in matches start, ..., stop - 1, which the worker 
+#                   seeks to itself. result is None unless the set
+#                   passed; duplicates within the chunk are reported
+#                   as not passing, since the caller skips them anyway.
+#   - num_built:    spread sets built, for scan.get_progress()
+#   - report:       the chunk's scan_metrics.get_report(), except for
+#                   counts of matches enumerated, duplicated across 
+#                   chunks and passed, which the caller keeps
+def check_chunk(bounds):
+    data_store = worker_scan.get_data_store()
+    filters = worker_scan.get_sorted_filters()
+    metrics = scan_metrics()
+    worker_scan.set_metrics(metrics)
+    data_store.set_metrics(metrics)
+    matches = data_store.get_unique_matches(
+        data_store.get_live_matches(
+            metrics.timed(
+                "enumerate",
+                data_store.get_iterator(worker_scan.get_legs()).slice(*bounds)
+            )
+        )
+    )
+    checked = []
+    seen = set()
+    num_built = 0
+
+    for match, spread_set in metrics.timed(
+        "get_spread_set", data_store.get_spread_sets(matches)
+    ):
+        if spread_set:
+            num_built += 1
+        else:
+            metrics.count("no_spreads")
+
+        if spread_set and not spread_set.get_live():
+            metrics.count("dead")
+
+        if (spread_set and spread_set.get_live()):
+            agg_id = spread_set.get_latest()[spread_set_row.agg_id]
+            result = None
+
+            if  agg_id not in seen and \
+                worker_scan.check_filters(filters, spread_set):
+                result = worker_scan.get_result(match, spread_set, filters)
+
+            seen.add(agg_id)
+            checked.append(( match, agg_id, result ))
+
+    return [ checked, num_built, metrics.get_report() ]
+
+
+# a passing spread set without its rows, so results don't hold every 
+# spread set's history. small enough for workers to return.
+#   - latest:   the spread set's latest row, see spread_set_row
+#   - values:   { filter type: latest value }
+#   - stats:    { stat: { "mean", "median", "std" } } for each stat 
+#               the scan added
+#   - score:    ranked scans only, see SCORE_BOUNDS
+class scan_result:
+    def __init__(self, match, spread_set, filters):
+        latest = list(spread_set.get_latest())
+
+        self.set_match(match)
+        self.set_latest(latest)
+        self.set_values(
+            { f["type"]: latest[spread_set_index[f["type"]]] for f in filters }
+        )
+        self.set_stats(
+            {
+                stat: { key: stat_dict[key] for key in STAT_SUMMARY }
+                for stat, stat_dict in spread_set.get_stats().items()
+            }
+        )
+        self.set_score(None)
+
+    def set_match(self, match): self.match = match
+    def get_match(self): return self.match
+    def set_latest(self, latest): self.latest = latest
+    def get_latest(self): return self.latest
+    def set_values(self, values): self.values = values
+    def get_values(self): return self.values
+    def set_stats(self, stats): self.stats = stats
+    def get_stats(self): return self.stats
+    def get_stat(self, stat): return self.stats[stat]
+    def set_score(self, score): self.score = score
+    def get_score(self): return self.score
+
+    # rebuilds the spread set, with the same stats and the full 
+    # columns of the filters' stats, from the store the scan ran on, 
+    # e.g. for plotting
+    def get_data(self, data_store):
+        spread_set = data_store.get_spread_set(self.get_match())
+
+        if spread_set:
+            spread_set.add_stats(
+                list(self.get_stats()) + 
+                [ stat for stat in self.get_values() if stat not in self.get_stats() ]
+            )
+
+        return spread_set
+
 
 class scan:
-    def __init__(self, scan_def, cursor):
+    # data_store: built by the caller, e.g. shared across a batch
+    def __init__(self, scan_def, db, cache = None, data_store = None):
         self.set_name(scan_def["name"])
         self.set_contract(scan_def["contract"])
         self.set_type(scan_def["type"])
@@ -13,8 +159,21 @@ class scan:
         self.set_result_limit(scan_def["result_limit"])
         self.set_legs(scan_def["legs"])
         self.set_filters(scan_def["filters"])
+        # optional: processes to spread the matches over
+        self.set_workers(scan_def.get("workers", 1))
+        # optional: keep the result_limit best results instead of the
+        # first, e.g. { "score": "std", "stat": "settle" }, see 
+        # SCORE_BOUNDS. "bound" overrides the best possible score.
+        self.set_ranking(scan_def.get("ranking"))
+        self.set_callback(None)
+        self.init_progress()
+        self.init_metrics()
 
-        self.init_data_store(cursor)
+        if data_store:
+            self.set_data_store(data_store)
+        else:
+            with self.get_metrics().time("load"):
+                self.init_data_store(db, cache)
         
     def set_data_range(self, data_range): self.data_range = data_range
     def get_data_range(self): return self.data_range
@@ -32,42 +191,118 @@ class scan:
     def get_legs(self): return self.legs
     def set_result_limit(self, lim): self.result_limit = lim
     def get_result_limit(self): return self.result_limit
+    def set_workers(self, workers): self.workers = workers
+    def get_workers(self): return self.workers
+    def set_ranking(self, ranking): self.ranking = ranking
+    def get_ranking(self): return self.ranking
+    def set_callback(self, callback): self.callback = callback
+    def get_callback(self): return self.callback
+    def set_progress(self, progress): self.progress = progress
+    def get_progress(self): return self.progress
+    # stage timings and match counts over the scan's lifetime:
+    #   - load:             building the store, unless it was passed in
+    #   - enumerate:        the match iterator
+    #   - live, dedup:      data_store.get_live_matches(), 
+    #                       get_unique_matches()
+    #   - get_spread_set:   building spread sets, except organize
+    #   - organize:         spread_set.organize()
+    #   - stat:<stats>:     spread_set.add_stats()
+    #   - latest:<stats>:   spread_set.add_latest_stats()
+    #   - filter:<type>:    checking a filter, except its stat
+    # counters: enumerated, no_spreads (no year bound a listed 
+    # contract, or no rows), dead, duplicate, passed
+    def set_metrics(self, metrics): self.metrics = metrics
+    def get_metrics(self): return self.metrics
 
-    def init_data_store(self, cursor):
-        data_store = None
-        type = self.get_type()
+    def init_metrics(self):
+        metrics = scan_metrics()
 
-        contract = self.get_contract()
-        data_range = self.get_data_range()
+        for counter in SCAN_COUNTERS:
+            metrics.count(counter, 0)
 
-        if type == "calendar":
-            data_store = contract_store(contract, data_range, cursor)
-        elif type == "sequence":
-            data_store = terms_store(contract, data_range, cursor)
-        
-        self.set_data_store(data_store)
+        self.set_metrics(metrics)
 
-    def check_filter(self, filter, spread_set):
-        type = filter["type"]
-        mode = filter["mode"]
-        rng = filter["range"]
+    # counts for the running scan:
+    #   - enumerated:   matches taken from the iterator
+    #   - built:        spread sets built from them
+    #   - passed:       spread sets that passed every filter
+    #   - total:        matches the iterator yields, once known. known
+    #                   with a callback, or with more than one worker.
+    def init_progress(self):
+        self.set_progress(
+            {
+                "enumerated": 0,
+                "built": 0,
+                "passed": 0,
+                "total": None
+            }
+        )
 
-        i = spread_set_index[type]
-        stats = spread_set.get_stat(type)
+    # calls the stream() callback, if any, with the current counts
+    def report(self):
+        callback = self.get_callback()
 
-        latest = spread_set.get_latest()
-        val = latest[i]
+        if callback:
+            callback(dict(self.get_progress()))
 
-        in_rng = False 
-            
-        for j in range(len(rng)):
-            lower = rng[j][0]
-            upper = rng[j][1]
+    # matches, counted as they are taken, with a report every 
+    # CHUNK_SIZE matches
+    def count_matches(self, matches):
+        progress = self.get_progress()
+        metrics = self.get_metrics()
+
+        for match in metrics.timed("enumerate", matches):
+            progress["enumerated"] += 1
+            metrics.count("enumerated")
+
+            if progress["enumerated"] % CHUNK_SIZE == 0:
+                self.report()
+
+            yield match
 
-            if mode == "std":
+    def init_data_store(self, db, cache):
+        self.set_data_store(
+            get_data_store(
+                self.get_type(),
+                self.get_contract(),
+                self.get_data_range(),
+                db,
+                cache
+            )
+        )
+
+    # filter's ranges, as [ ( lower, upper ), ... ] values of its stat
+    #   - stats: the stat's summary, e.g. spread_set.get_stat(), for
+    #            "std" filters; None for "abs" filters
+    def get_bounds(self, filter, stats):
+        bounds = []
+
+        for lower, upper in filter["range"]:
+            if filter["mode"] == "std":
                 lower = stats["median"] + lower * stats["std"]
                 upper = stats["median"] + upper * stats["std"]
 
+            bounds.append(( lower, upper ))
+
+        return bounds
+
+    def check_filter(self, filter, spread_set):
+        i = spread_set_index[filter["type"]]
+
+        latest = spread_set.get_latest()
+        val = latest[i]
+
+        # e.g. vol before its first full window
+        if val is None:
+            return None
+
+        in_rng = False 
+            
+        for lower, upper in self.get_bounds(
+            filter, 
+            spread_set.get_stat(filter["type"]) 
+            if filter["mode"] == "std" else None
+        ):
             in_rng =    in_rng or \
                         (
                             val >= lower and
@@ -78,30 +313,83 @@ class scan:
         
         return None
 
-    def execute(self):
-        filters = self.get_filters()
-        response = {
-            "name":     self.get_name(),
-            "contract": self.get_contract(),
-            "results":  []
-        }
-        results = response["results"]
-        result_limit = self.get_result_limit()
-        stats = [ filter["type"] for filter in filters ]
+    # filters are AND'd, so checking the cheapest first means most
+    # spread sets fail before the expensive stats are added. filters on
+    # other spread_set_row fields, e.g. "change" or "days_listed", cost
+    # as much as the most expensive stat; the sort is stable, so ties
+    # keep their given order.
+    def get_sorted_filters(self):
+        max_cost = max(STAT_COST.values())
+
+        return sorted(
+            self.get_filters(), 
+            key = lambda f: STAT_COST.get(f["type"], max_cost)
+        )
+
+    # filters are AND'd, ranges are OR'd
+    def check_filters(self, filters, spread_set):
+        metrics = self.get_metrics()
+
+        for f in filters:
+            with metrics.time("filter:" + f["type"]):
+                # stats are added on demand, per filter. "abs" filters
+                # only read the latest row, so only that is evaluated
+                if f["mode"] == "std":
+                    spread_set.add_stats([ f["type"] ])
+                else:
+                    spread_set.add_latest_stats([ f["type"] ])
+                val = self.check_filter(f, spread_set)
+
+            if val is None:
+                return False
+
+        return True
+
+    # a passing spread set's scan_result, with the ranking's stat too
+    def get_result(self, match, spread_set, filters):
+        ranking = self.get_ranking()
+
+        if ranking and ranking["score"] == "std":
+            spread_set.add_stats([ ranking["stat"] ])
+
+        return scan_result(match, spread_set, filters)
+
+    # yields a scan_result for each passing spread set, in match order
+    def get_results(self, filters):
+        if self.get_workers() > 1:
+            yield from self.get_results_parallel(filters)
+            return
+
         data_store = self.get_data_store()
-        it = data_store.get_iterator(self.get_legs())
-        seen = set()
+        progress = self.get_progress()
+        metrics = self.get_metrics()
+        data_store.set_metrics(metrics)
+        matches = data_store.get_iterator(self.get_legs())
 
-        print(f"starting scan: {self.get_name()}")
-        start = datetime.now()
+        # counting is a second pass over the iteration, so it is only
+        # paid for when someone is told the total
+        if self.get_callback():
+            progress["total"] = matches.count()
 
-        for match in it:
-            spread_set = data_store.get_spread_set(match)
+        it = data_store.get_unique_matches(
+            data_store.get_live_matches(self.count_matches(matches))
+        )
+        seen = set()
 
+        for match, spread_set in metrics.timed(
+            "get_spread_set", data_store.get_spread_sets(it)
+        ):
             #print(match)
 
+            if spread_set:
+                progress["built"] += 1
+            else:
+                metrics.count("no_spreads")
+
+            if spread_set and not spread_set.get_live():
+                metrics.count("dead")
+
             if (spread_set and spread_set.get_live()):
-                spread_set.add_stats(stats)
                 latest = spread_set.get_latest()
 
                 # could remove duplicates in 
@@ -111,34 +399,182 @@ class scan:
                 if not agg_id in seen:
                     seen.add(agg_id)
                 else: 
+                    metrics.count("duplicate")
                     continue
 
-                # check filters
-                # filters are AND'd, ranges are OR'd
-                pass_all = True
+                if self.check_filters(filters, spread_set):
+                    progress["passed"] += 1
+                    metrics.count("passed")
+                    self.report()
 
-                for f in filters:
-                    val = self.check_filter(f, spread_set)
+                    yield self.get_result(match, spread_set, filters)
 
-                    if (not val):
-                        pass_all = False
-                        break
-                    else:
-                        pass
+    # get_results(), with CHUNK_SIZE matches at a time checked by a 
+    # pool of forked workers. chunks are sent as bounds into the 
+    # iteration rather than as matches, and come back as scan_results.
+    # they are merged in order, so results and duplicates are the same
+    # as with one worker.
+    def get_results_parallel(self, filters):
+        # imported here, so scans with one worker don't pay for it
+        from multiprocessing import get_context
 
-                if (pass_all):
-                    results.append(
-                        {
-                            "match": match, 
-                            "data": spread_set
-                        }
-                    )
+        global worker_scan
 
-            if (result_limit and len(results) >= result_limit): break
+        data_store = self.get_data_store()
+        metrics = self.get_metrics()
 
-        print("elapsed:", datetime.now() - start)
+        with metrics.time("load"):
+            data_store.init_engine()
+
+        worker_scan = self
+        progress = self.get_progress()
+        num_matches = data_store.get_iterator(self.get_legs()).count()
+        progress["total"] = num_matches
+        chunks = [
+            ( start, min(start + CHUNK_SIZE, num_matches) )
+            for start in range(0, num_matches, CHUNK_SIZE)
+        ]
+        seen = set()
+
+        # workers must not use SQLite connections inherited from this
+        # process: idle ones are closed before forking, and each worker
+        # starts with empty pools, opening its own connections if it
+        # needs any
+        close_pools()
+
+        # leaving the pool, e.g. when the caller stops at result_limit,
+        # terminates any chunks still running
+        with get_context("fork").Pool(
+            self.get_workers(), initializer = reset_pools
+        ) as pool:
+            for bounds, ( checked, num_built, report ) in zip(
+                chunks, pool.imap(check_chunk, chunks)
+            ):
+                progress["enumerated"] = bounds[1]
+                progress["built"] += num_built
+                metrics.merge(report)
+                metrics.count("enumerated", bounds[1] - bounds[0])
+                self.report()
+
+                for match, agg_id, result in checked:
+                    if agg_id in seen:
+                        metrics.count("duplicate")
+                        continue
+
+                    seen.add(agg_id)
+
+                    if result:
+                        progress["passed"] += 1
+                        metrics.count("passed")
+                        self.report()
+
+                        yield result
+
+    # see SCORE_BOUNDS
+    #   - result: a scan_result from get_result()
+    def get_score(self, filters, result):
+        ranking = self.get_ranking()
+        latest = result.get_latest()
+
+        if ranking["score"] == "std":
+            stat = ranking["stat"]
+            stats = result.get_stat(stat)
+            val = latest[spread_set_index[stat]]
+
+            if val is None or not stats["std"]:
+                return float("-inf")
+
+            return abs(val - stats["median"]) / stats["std"]
+
+        score = 0
+
+        for f in filters:
+            val = latest[spread_set_index[f["type"]]]
+
+            stats = result.get_stat(f["type"]) if f["mode"] == "std" else None
+
+            for lower, upper in self.get_bounds(f, stats):
+                if lower <= val <= upper:
+                    if upper > lower:
+                        score += min(val - lower, upper - val) / (upper - lower)
 
-        if (result_limit):
-            response["results"] = results[:result_limit]
+                    break
+
+        return score
+
+    # the result_limit best results, best first, with ties in match 
+    # order. only result_limit results are held at a time, and the 
+    # search stops once none of them can be beaten.
+    #   - returns: [ scan_result, ... ], with scores set
+    def get_ranked_results(self, results, filters):
+        ranking = self.get_ranking()
+        result_limit = self.get_result_limit()
+        bound = ranking.get("bound", SCORE_BOUNDS[ranking["score"]](filters))
+        # ( score, -i, result ): the root is the worst result kept
+        heap = []
+
+        for i, result in enumerate(results):
+            entry = ( self.get_score(filters, result), -i, result )
+
+            if not result_limit or len(heap) < result_limit:
+                heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapreplace(heap, entry)
+
+            if  bound is not None and result_limit and \
+                len(heap) == result_limit and heap[0][0] >= bound:
+                break
+
+        results = []
+
+        for score, _, result in sorted(heap, reverse = True):
+            result.set_score(score)
+            results.append(result)
+
+        return results
+
+    # yields results as they are found, up to result_limit. ranked
+    # scans yield theirs, best first, once the search is done.
+    #   - progress: optional, called with a copy of get_progress()
+    #               every CHUNK_SIZE matches, on each passing spread
+    #               set and when the scan ends
+    def stream(self, progress = None):
+        filters = self.get_sorted_filters()
+        result_limit = self.get_result_limit()
+
+        self.set_callback(progress)
+        self.init_progress()
+
+        it = self.get_results(filters)
+
+        try:
+            if self.get_ranking():
+                yield from self.get_ranked_results(it, filters)
+            else:
+                num_results = 0
+
+                for result in it:
+                    yield result
+                    num_results += 1
+
+                    if (result_limit and num_results >= result_limit): break
+        finally:
+            # stops any workers still checking matches
+            it.close()
+            self.report()
+
+    def execute(self):
+        response = {
+            "name":     self.get_name(),
+            "contract": self.get_contract(),
+            "results":  []
+        }
+
+        print(f"starting scan: {self.get_name()}")
+        start = datetime.now()
+
+        response["results"] = list(self.stream())
+
+        print("elapsed:", datetime.now() - start)
 
-        return response
\ No newline at end of file
+        return response
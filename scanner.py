@@ -1,31 +1,181 @@
-from json import loads
-from scan import scan
-from sqlite3 import connect
+from data.cache import data_cache
+from data.data_store import load_columns
+from data.db import get_pool
+from data.metrics import prometheus_text, scan_metrics
+from json import dumps, loads
+from profiling import get_env_options, make_options, profiled, set_options
+from scan import get_data_store, scan
+from sys import argv, stderr
 
 
 with open("./config.json") as fd:
     config = loads(fd.read())
 
-def batch_execute(batch):
-    connection = connect(config["db_path"])
-    cursor = connection.cursor()
-    results = []
+# loads each contract once, over the union of its scans' data_range,
+# with one query per distinct union
+#   - returns: { contract: columns }
+def load_batch(batch, db, cache):
+    ranges = {}
+    contracts = {}
+    columns = {}
 
     for scan_def in batch:
-        s = scan(scan_def, cursor)
-        rs = s.execute()
-        # discard spread_set data, output match string only
-        rs["results"] = [ r["match"] for r in rs["results"] ]
-        results.append(rs)
+        contract = scan_def["contract"]
+        start, end = scan_def["data_range"]
+
+        if contract in ranges:
+            start = min(start, ranges[contract][0])
+            end = max(end, ranges[contract][1])
+
+        ranges[contract] = ( start, end )
+
+    for contract, data_range in ranges.items():
+        contracts.setdefault(data_range, []).append(contract)
+
+    for data_range, group in contracts.items():
+        columns.update(load_columns(db, group, list(data_range), cache))
+
+    return columns
+
+
+# a scan for each definition in batch, in order. scans with the same 
+# type, contract and data_range share one store; the rest get their
+# own store over a slice of the shared rows
+#   - metrics:  optional scan_metrics for the shared load; building a
+#               store counts towards the first scan using it
+def get_scans(batch, metrics = None):
+    db = get_pool(config["db_path"])
+    cache = data_cache(config["cache_dir"]) if "cache_dir" in config else None
+    metrics = metrics or scan_metrics()
+
+    with metrics.time("load_batch"):
+        columns = load_batch(batch, db, cache)
+
+    stores = {}
+
+    for scan_def in batch:
+        key = (
+            scan_def["type"],
+            scan_def["contract"],
+            tuple(scan_def["data_range"])
+        )
+
+        load = scan_metrics()
+
+        if key not in stores:
+            with load.time("load"):
+                stores[key] = get_data_store(
+                    scan_def["type"],
+                    scan_def["contract"],
+                    scan_def["data_range"],
+                    db,
+                    cache,
+                    columns[scan_def["contract"]]
+                )
+
+        s = scan(scan_def, db, cache, stores[key])
+        s.get_metrics().merge(load.get_report())
+
+        yield s
+
+
+# every scan's results, with "metrics": scan_metrics.get_report()
+#   - metrics: see get_scans()
+def batch_execute(batch, metrics = None):
+    results = []
 
-    connection.close()
+    for s in get_scans(batch, metrics):
+        with profiled(s.get_name()):
+            rs = s.execute()
+
+        # output match string only
+        rs["results"] = [ r.get_match() for r in rs["results"] ]
+        rs["metrics"] = s.get_metrics().get_report()
+        results.append(rs)
 
     return results
 
+
+# yields { "name", "contract", "match" }, plus "score" if ranked, for 
+# each result as soon as its scan finds it
+#   - progress: optional, called with ( name, counts ), see scan.stream()
+#   - metrics:  see get_scans()
+#   - reports:  optional dict, filled with { name: metrics report } as
+#               each scan ends
+def batch_stream(batch, progress = None, metrics = None, reports = None):
+    for s in get_scans(batch, metrics):
+        callback = None
+
+        if progress:
+            callback = lambda counts, name = s.get_name(): \
+                progress(name, counts)
+
+        # includes the time the caller takes per record
+        with profiled(s.get_name()):
+            for result in s.stream(callback):
+                record = {
+                    "name": s.get_name(),
+                    "contract": s.get_contract(),
+                    "match": result.get_match()
+                }
+
+                if result.get_score() is not None:
+                    record["score"] = result.get_score()
+
+                yield record
+
+        if reports is not None:
+            reports[s.get_name()] = s.get_metrics().get_report()
+
+
+def print_progress(name, counts):
+    print(name, dumps(counts), file = stderr)
+
+
+# writes <prefix>.json and <prefix>.prom
+#   - reports: { scan name: scan_metrics.get_report() }
+def write_metrics(prefix, reports):
+    with open(prefix + ".json", "w") as fd:
+        fd.write(dumps(reports, indent = 2))
+
+    with open(prefix + ".prom", "w") as fd:
+        fd.write(prometheus_text(reports))
+
+
+# usage: python scanner.py [--jsonl] [--progress] [--metrics PREFIX]
+#                           [--profile MODES]
+#   - --jsonl:      prints each result as a JSON line when it is found,
+#                   instead of every scan's results at the end
+#   - --progress:   prints progress counts to stderr, with --jsonl
+#   - --metrics:    writes every scan's timings and counts, see 
+#                   scan.get_metrics(), to PREFIX.json and PREFIX.prom.
+#                   the shared load is reported as scan "batch".
+#   - --profile:    profiles each scan, e.g. "cpu,mem", see profiling.py.
+#                   defaults to SCAN_PROFILE.
 if __name__=="__main__":
-    all_results = batch_execute(config["scans"])
+    args = argv[1:]
+    metrics = scan_metrics()
+    reports = {}
+
+    if "--profile" in args:
+        set_options(make_options(args[args.index("--profile") + 1]))
+    else:
+        set_options(get_env_options())
+
+    if "--jsonl" in args:
+        progress = print_progress if "--progress" in args else None
+
+        for record in batch_stream(config["scans"], progress, metrics, reports):
+            print(dumps(record), flush = True)
+    else:
+        all_results = batch_execute(config["scans"], metrics)
+
+        for result_set in all_results:
+            reports[result_set["name"]] = result_set["metrics"]
+            print(result_set["name"], result_set["contract"])
+            for result in result_set["results"]:
+                print(result)
 
-    for result_set in all_results:
-        print(result_set["name"], result_set["contract"])
-        for result in result_set["results"]:
-            print(result)
\ No newline at end of file
+    if "--metrics" in args:
+        reports["batch"] = metrics.get_report()
+        write_metrics(args[args.index("--metrics") + 1], reports)
\ No newline at end of file
@@ -0,0 +1,193 @@
+from data.data_store import \
+    DERIVED_TABLE, ORDINAL_OFFSET, ROW_COLUMNS, rows_query
+from json import loads
+from sqlite3 import connect
+from sys import argv
+
+
+# covering indexes for data_store.rows_query():
+#   - metadata rows for one name, without touching the table
+#   - ohlc rows for one contract_id, in date order
+INDEXES = [
+    '''
+        CREATE INDEX IF NOT EXISTS metadata_name_contract
+        ON metadata(name, contract_id, month, year, from_date);
+    ''',
+    '''
+        CREATE INDEX IF NOT EXISTS ohlc_contract_date
+        ON ohlc(contract_id, date, settle);
+    '''
+]
+
+# ROW_COLUMNS of a single ohlc row, for the triggers below
+def row_select(row):
+    return f'''
+        SELECT contract_id, name, {ROW_COLUMNS}
+        FROM (
+            SELECT
+                {row}.contract_id AS contract_id,
+                {row}.date AS date,
+                {row}.settle AS settle
+        ) INNER JOIN metadata USING(contract_id)
+    '''
+
+# rebuilds every derived row of one contract_id, for the metadata
+# triggers below
+def contract_rebuild(row):
+    return f'''
+        DELETE FROM {DERIVED_TABLE} WHERE contract_id = {row}.contract_id;
+        INSERT INTO {DERIVED_TABLE}
+        SELECT contract_id, name, {ROW_COLUMNS}
+        FROM ohlc INNER JOIN metadata USING(contract_id)
+        WHERE contract_id = {row}.contract_id;
+    '''
+
+# precomputed ROW_COLUMNS for data_store.rows_query(derived), kept in sync
+# with ohlc and metadata by triggers
+DERIVED = [
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_insert;",
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_delete;",
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_update;",
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_metadata_insert;",
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_metadata_delete;",
+    f"DROP TRIGGER IF EXISTS {DERIVED_TABLE}_metadata_update;",
+    f"DROP TABLE IF EXISTS {DERIVED_TABLE};",
+    f'''
+        CREATE TABLE {DERIVED_TABLE} (
+            contract_id INTEGER,
+            name TEXT,
+            month INTEGER,
+            year INTEGER,
+            date INTEGER,
+            settle REAL,
+            days_listed REAL
+        );
+    ''',
+    f'''
+        INSERT INTO {DERIVED_TABLE}
+        SELECT contract_id, name, {ROW_COLUMNS}
+        FROM ohlc INNER JOIN metadata USING(contract_id);
+    ''',
+    f'''
+        CREATE INDEX {DERIVED_TABLE}_name_date
+        ON {DERIVED_TABLE}(name, date, year, month, settle, days_listed);
+    ''',
+    f'''
+        CREATE INDEX {DERIVED_TABLE}_contract_date
+        ON {DERIVED_TABLE}(contract_id, date);
+    ''',
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_insert AFTER INSERT ON ohlc
+        BEGIN
+            INSERT INTO {DERIVED_TABLE} {row_select("NEW")};
+        END;
+    ''',
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_delete AFTER DELETE ON ohlc
+        BEGIN
+            DELETE FROM {DERIVED_TABLE}
+            WHERE contract_id = OLD.contract_id
+            AND date = CAST(julianday(OLD.date) - {ORDINAL_OFFSET} AS INTEGER);
+        END;
+    ''',
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_update AFTER UPDATE ON ohlc
+        BEGIN
+            DELETE FROM {DERIVED_TABLE}
+            WHERE contract_id = OLD.contract_id
+            AND date = CAST(julianday(OLD.date) - {ORDINAL_OFFSET} AS INTEGER);
+            INSERT INTO {DERIVED_TABLE} {row_select("NEW")};
+        END;
+    ''',
+    # e.g. metadata inserted after its contract's ohlc rows, or a
+    # corrected from_date
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_metadata_insert
+        AFTER INSERT ON metadata
+        BEGIN
+            {contract_rebuild("NEW")}
+        END;
+    ''',
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_metadata_delete
+        AFTER DELETE ON metadata
+        BEGIN
+            {contract_rebuild("OLD")}
+        END;
+    ''',
+    f'''
+        CREATE TRIGGER {DERIVED_TABLE}_metadata_update
+        AFTER UPDATE ON metadata
+        BEGIN
+            {contract_rebuild("OLD")}
+            {contract_rebuild("NEW")}
+        END;
+    '''
+]
+
+
+def explain(cursor, query, params):
+    return [
+        row[3] for row in
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+    ]
+
+
+def print_plans(cursor, label):
+    params = ( "", "0000-00-00", "9999-99-99" )
+    plans = [ ( "rows_query", explain(cursor, rows_query(1), params) ) ]
+
+    derived = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+        ( DERIVED_TABLE, )
+    ).fetchone()
+
+    if derived:
+        plans.append(
+            (
+                "rows_query (derived)",
+                explain(cursor, rows_query(1, True), ( "", 0, 0 ))
+            )
+        )
+
+    print(label)
+
+    for name, plan in plans:
+        print(f"  {name}:")
+        for step in plan:
+            print(f"    {step}")
+
+
+# usage: python schema.py [--materialize]
+#   - creates covering indexes for the data_store load query
+#   - --materialize (re)builds the derived table, which data_store
+#     reads instead of joining ohlc and metadata
+def bootstrap(db_path, materialize):
+    connection = connect(db_path)
+    cursor = connection.cursor()
+
+    print_plans(cursor, "before:")
+
+    for statement in INDEXES:
+        cursor.execute(statement)
+
+    if materialize:
+        for statement in DERIVED:
+            cursor.execute(statement)
+
+    connection.commit()
+    cursor.execute("ANALYZE;")
+    connection.commit()
+
+    print_plans(cursor, "after:")
+
+    connection.close()
+
+
+# config.json is read here rather than at import, so synth_db.py and
+# bench.py can import INDEXES from any directory
+if __name__ == "__main__":
+    with open("./config.json") as fd:
+        config = loads(fd.read())
+
+    bootstrap(config["db_path"], "--materialize" in argv[1:])
@@ -0,0 +1,232 @@
+from data.domain import MONTH_I2A
+from datetime import date, timedelta
+from numpy import arange, array, cos, cumsum, exp, pi, rint
+from numpy.random import default_rng
+from os import remove
+from os.path import exists
+from schema import INDEXES
+from sqlite3 import connect
+from sys import argv
+
+
+# a synthetic database with the same metadata and ohlc tables as the
+# real one, for benchmarks on machines without it. the same arguments
+# always write the same rows.
+
+# product names, in order; products past these are named P<i>
+PRODUCT_NAMES = [ "LN", "CL", "NG", "HO", "RB", "ZC", "ZS", "ZW" ]
+
+# listing schedule, as fractions of the term depth: every month is
+# listed up to MONTHLY_DEPTH of it before expiry, H, M, U and Z up to
+# QUARTERLY_DEPTH, and Z alone over the whole depth
+MONTHLY_DEPTH = 0.5
+QUARTERLY_DEPTH = 0.75
+QUARTERLY_MONTHS = ( 2, 5, 8, 11 )
+
+# exchange holidays, as ( month, day ), skipped every year
+HOLIDAYS = [ ( 1, 1 ), ( 7, 4 ), ( 12, 25 ) ]
+
+TICK = 0.01     # settles are rounded to this
+
+METADATA_TABLE = '''
+    CREATE TABLE metadata (
+        contract_id INTEGER PRIMARY KEY,
+        name TEXT,
+        month TEXT,
+        year TEXT,
+        from_date TEXT,
+        to_date TEXT
+    );
+'''
+
+OHLC_TABLE = '''
+    CREATE TABLE ohlc (
+        contract_id INTEGER,
+        date TEXT,
+        open REAL,
+        high REAL,
+        low REAL,
+        settle REAL
+    );
+'''
+
+
+def get_product_names(num_products):
+    return [
+        PRODUCT_NAMES[i] if i < len(PRODUCT_NAMES) else f"P{i}"
+        for i in range(num_products)
+    ]
+
+
+# trading days from start to end, inclusive
+def get_days(start, end):
+    days = []
+    day = start
+
+    while day <= end:
+        if day.weekday() < 5 and ( day.month, day.day ) not in HOLIDAYS:
+            days.append(day)
+
+        day += timedelta(days = 1)
+
+    return days
+
+
+def add_months(day, months):
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+
+    return date(year, month + 1, 1)
+
+
+# ( from_date, to_date ) of the month (0-11) contract of year. contracts
+# expire a few days before their month, like energy futures.
+#   - depth: listing horizon of the furthest contract, in months
+def get_listing(month, year, depth):
+    to_date = date(year, month + 1, 1) - timedelta(days = 4)
+
+    if month == 11:
+        months = depth
+    elif month in QUARTERLY_MONTHS:
+        months = int(depth * QUARTERLY_DEPTH)
+    else:
+        months = int(depth * MONTHLY_DEPTH)
+
+    return add_months(to_date, -months), to_date
+
+
+# daily curve factors of one product, one value per day:
+#   - level:    log random walk of the front of the curve
+#   - carry:    slope of the curve per year to expiry, mean reverting
+#               between contango and backwardation
+def get_factors(rng, num_days):
+    level = 50 * exp(cumsum(rng.normal(0, 0.015, num_days)))
+    carry = [ 0.0 ]
+
+    for shock in rng.normal(0, 0.004, num_days - 1):
+        carry.append(carry[-1] * 0.995 + shock)
+
+    return level, array(carry) + rng.uniform(-0.02, 0.05)
+
+
+# [ ( month, year, from_date, to_date, [ ( date, settle ), ... ] ), ... ]
+#   - seasonal curves peak in a month drawn per product
+def get_contracts(rng, days, depth):
+    level, carry = get_factors(rng, len(days))
+    peak = rng.integers(0, 12)
+    season = rng.uniform(0.02, 0.1)
+    ordinals = array([ day.toordinal() for day in days ])
+    contracts = []
+
+    for year in range(days[0].year, days[-1].year + depth // 12 + 2):
+        for month in range(12):
+            from_date, to_date = get_listing(month, year, depth)
+            listed = (ordinals >= from_date.toordinal()) & \
+                     (ordinals <= to_date.toordinal())
+
+            if not listed.any():
+                continue
+
+            idx = arange(len(days))[listed]
+            years_left = (to_date.toordinal() - ordinals[idx]) / 365
+            settles = level[idx] * (
+                1 +
+                carry[idx] * years_left +
+                season * cos(2 * pi * (month - peak) / 12) +
+                rng.normal(0, 0.002, len(idx))
+            )
+            settles = rint(settles / TICK) * TICK
+            contracts.append(
+                (
+                    MONTH_I2A[month],
+                    year,
+                    from_date,
+                    to_date,
+                    [ ( days[i], settle ) for i, settle in zip(idx, settles) ]
+                )
+            )
+
+    return contracts
+
+
+#   - num_products: products to write, see PRODUCT_NAMES
+#   - years:        years of history, ending at end
+#   - depth:        months from listing to expiry of the furthest
+#                   contract, see get_listing()
+#   - end:          last trading day, e.g. yesterday for live spreads
+#   - indexed:      also creates schema.INDEXES
+def generate(path, num_products, years, depth, seed, end, indexed):
+    if exists(path):
+        remove(path)
+
+    rng = default_rng(seed)
+    days = get_days(end - timedelta(days = round(365.25 * years)), end)
+    connection = connect(path)
+    cursor = connection.cursor()
+    cursor.execute(METADATA_TABLE)
+    cursor.execute(OHLC_TABLE)
+    contract_id = 0
+
+    for name in get_product_names(num_products):
+        for month, year, from_date, to_date, rows in \
+            get_contracts(rng, days, depth):
+            contract_id += 1
+            cursor.execute(
+                "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?);",
+                (
+                    contract_id,
+                    name,
+                    month,
+                    str(year),
+                    from_date.isoformat(),
+                    to_date.isoformat()
+                )
+            )
+            cursor.executemany(
+                "INSERT INTO ohlc VALUES (?, ?, ?, ?, ?, ?);",
+                [
+                    (
+                        contract_id,
+                        day.isoformat(),
+                        float(settle),
+                        float(settle),
+                        float(settle),
+                        float(settle)
+                    )
+                    for day, settle in rows
+                ]
+            )
+
+    if indexed:
+        for statement in INDEXES:
+            cursor.execute(statement)
+
+    connection.commit()
+    connection.close()
+
+
+def get_arg(args, name, default):
+    return args[args.index(name) + 1] if name in args else default
+
+
+# usage: python synth_db.py PATH [--products N] [--years N] [--depth N]
+#                           [--seed N] [--end YYYY-MM-DD] [--indexed]
+#   - --products:   number of products, default 2
+#   - --years:      years of history, default 15
+#   - --depth:      term depth in months, default 72
+#   - --seed:       random seed, default 1
+#   - --end:        last trading day, default yesterday. pin it for a
+#                   database that is the same every day.
+#   - --indexed:    creates the covering indexes, see schema.py
+if __name__ == "__main__":
+    args = argv[1:]
+    end = get_arg(args, "--end", None)
+
+    generate(
+        args[0],
+        int(get_arg(args, "--products", 2)),
+        int(get_arg(args, "--years", 15)),
+        int(get_arg(args, "--depth", 72)),
+        int(get_arg(args, "--seed", 1)),
+        date.fromisoformat(end) if end else date.today() - timedelta(days = 1),
+        "--indexed" in args
+    )
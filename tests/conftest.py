@@ -0,0 +1,87 @@
+from data.data_store import ENGINES
+from data.db import get_pool
+from datetime import date, timedelta
+from pytest import fixture
+from scan import get_data_store
+from synth_db import generate
+
+
+# a small synth_db.py database ending yesterday, so its spread sets are
+# live, and the stores and legs the tests scan it with
+
+PRODUCTS = 2
+YEARS = 3
+DEPTH = 24
+SEED = 1
+
+# product of each store type, see synth_db.PRODUCT_NAMES
+CONTRACTS = { "calendar": "LN", "sequence": "CL" }
+
+# as bench.BENCH_SCANS
+LEGS = {
+    "calendar": [
+        [ "F", "Z", "0", "1", "A" ],
+        [ "+1", "Z", "+0", "1", "B" ]
+    ],
+    "sequence": [
+        [ "0", "10", "A" ],
+        [ "+1", "+3", "B" ]
+    ]
+}
+
+MAX_SETS = 20   # live spread sets per store
+
+
+@fixture(scope = "session")
+def synth_db(tmp_path_factory):
+    path = tmp_path_factory.mktemp("synth") / "synth.db"
+    end = date.today() - timedelta(days = 1)
+    generate(str(path), PRODUCTS, YEARS, DEPTH, SEED, end, False)
+
+    return get_pool(str(path))
+
+
+# get_store(type, engine): a new store of type on synth_db
+@fixture
+def get_store(synth_db):
+    def get_store(type, engine = None):
+        start, end = next(
+            synth_db.query("SELECT MIN(date), MAX(date) FROM ohlc;")
+        )
+        data_store = get_data_store(
+            type, CONTRACTS[type], [ start, end ], synth_db, None
+        )
+
+        if engine:
+            data_store.set_engine(engine)
+            data_store.init_engine()
+
+        return data_store
+
+    return get_store
+
+
+# [ ( match, spread_set ), ... ]: the first MAX_SETS live spread sets
+def get_live_sets(data_store, type):
+    live = []
+
+    for match, spread_set in data_store.get_spread_sets(
+        data_store.get_iterator(LEGS[type])
+    ):
+        if spread_set and spread_set.get_live():
+            live.append(( match, spread_set ))
+
+        if len(live) == MAX_SETS:
+            break
+
+    return live
+
+
+@fixture(params = [ "calendar", "sequence" ])
+def type(request):
+    return request.param
+
+
+@fixture(params = ENGINES)
+def engine(request):
+    return request.param
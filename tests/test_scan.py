@@ -0,0 +1,81 @@
+from conftest import CONTRACTS, LEGS, get_live_sets
+from data.spread_set import spread_set_row
+from scan import scan
+
+
+def get_scan(data_store, type, filters):
+    return scan(
+        {
+            "name": "test",
+            "contract": CONTRACTS[type],
+            "type": type,
+            "data_range": None,
+            "result_limit": None,
+            "legs": LEGS[type],
+            "filters": filters
+        },
+        None,
+        None,
+        data_store
+    )
+
+
+# a filter on a stat the latest row has no value for fails, whatever 
+# its range
+def test_check_filter_none(get_store, engine):
+    data_store = get_store("calendar", engine)
+    filter = {
+        "type": "vol",
+        "mode": "abs",
+        "range": [ [ float("-inf"), float("inf") ] ]
+    }
+    s = get_scan(data_store, "calendar", [ filter ])
+
+    for _, spread_set in get_live_sets(data_store, "calendar"):
+        spread_set.add_latest_stats([ "vol" ])
+
+        assert spread_set.get_latest()[spread_set_row.vol] is None
+        assert s.check_filter(filter, spread_set) is None
+        assert not s.check_filters([ filter ], spread_set)
+
+
+def test_check_filter_value(get_store):
+    data_store = get_store("calendar")
+    filter = {
+        "type": "settle",
+        "mode": "abs",
+        "range": [ [ float("-inf"), float("inf") ] ]
+    }
+    s = get_scan(data_store, "calendar", [ filter ])
+
+    for _, spread_set in get_live_sets(data_store, "calendar"):
+        spread_set.add_stats([ "settle" ])
+
+        assert s.check_filter(filter, spread_set) == \
+               spread_set.get_latest()[spread_set_row.settle]
+
+
+# cheapest stats first; fields without a STAT_COST cost as much as the
+# most expensive stat, and ties keep their given order
+def test_sorted_filters():
+    filters = [
+        { "type": type, "mode": "abs", "range": [ [ 0, 1 ] ] }
+        for type in [ "change", "r_2", "days_listed", "rank", "settle" ]
+    ]
+    s = scan(
+        {
+            "name": "test",
+            "contract": None,
+            "type": None,
+            "data_range": None,
+            "result_limit": None,
+            "legs": [],
+            "filters": filters
+        },
+        None,
+        None,
+        True
+    )
+
+    assert [ f["type"] for f in s.get_sorted_filters() ] == \
+           [ "settle", "rank", "change", "r_2", "days_listed" ]
@@ -0,0 +1,101 @@
+from conftest import CONTRACTS, get_live_sets
+from data.domain import MONTH_I2A
+from data.spread_set import LATEST_STATS, WIN_PERIODS, spread_set_row
+from datetime import date
+
+
+# the latest row is rows[0], the set's earliest row
+def test_latest_is_first_row(get_store, type, engine):
+    data_store = get_store(type, engine)
+    live = get_live_sets(data_store, type)
+
+    assert live
+
+    for _, spread_set in live:
+        latest = spread_set.get_latest()
+        rows = spread_set.get_rows()
+
+        assert spread_set.get_latest_idx() == 0
+        assert latest == rows[0]
+        assert latest[spread_set_row.date] == min(
+            row[spread_set_row.date] for row in rows
+        )
+
+        # no window stat has a value before its spread's first window
+        spread_set.add_stats(list(LATEST_STATS))
+
+        for stat in LATEST_STATS:
+            assert spread_set.get_latest()[spread_set_row[stat]] is None
+
+
+# the latest row's settle, from the database: calendar agg_ids name 
+# their legs, e.g. ( "+G10", "-J10" )
+def test_latest_settle(synth_db, get_store, engine):
+    data_store = get_store("calendar", engine)
+
+    for _, spread_set in get_live_sets(data_store, "calendar"):
+        latest = spread_set.get_latest()
+        day = date.fromordinal(latest[spread_set_row.date]).isoformat()
+        settle = 0
+
+        for leg in latest[spread_set_row.agg_id]:
+            sign = 1 if leg[0] == "+" else -1
+            rows = list(
+                synth_db.query(
+                    '''
+                    SELECT settle FROM ohlc JOIN metadata USING (contract_id)
+                    WHERE name = ? AND month = ? AND substr(year, 3) = ? 
+                    AND date = ?;
+                    ''',
+                    ( CONTRACTS["calendar"], leg[1], leg[2:], day )
+                )
+            )
+
+            assert len(rows) == 1
+            assert leg[1] in MONTH_I2A
+            settle += sign * rows[0][0]
+
+        assert abs(latest[spread_set_row.settle] - settle) < 1e-9
+
+
+# the engines' window stats agree to the last bit, since the fast
+# engine reproduces the reference engine's running sums
+def test_window_stats_match_reference(get_store, type):
+    reference = get_live_sets(get_store(type, "reference"), type)
+    fast = get_live_sets(get_store(type, "fast"), type)
+
+    assert [ match for match, _ in reference ] == \
+           [ match for match, _ in fast ]
+
+    for ( _, a ), ( _, b ) in zip(reference, fast):
+        a.add_stats(list(LATEST_STATS))
+        b.add_stats(list(LATEST_STATS))
+
+        for row_a, row_b in zip(a.get_rows(), b.get_rows()):
+            for stat in LATEST_STATS:
+                assert row_a[spread_set_row[stat]] == \
+                       row_b[spread_set_row[stat]]
+
+
+# add_latest_stats() gives the full columns' value at any latest row
+def test_latest_stats_match_columns(get_store, type):
+    data_store = get_store(type, "fast")
+    checked = 0
+
+    for match, spread_set in get_live_sets(data_store, type):
+        spread_set.add_stats(list(LATEST_STATS))
+        rows = spread_set.get_rows()
+
+        for idx in range(0, len(rows), 7):
+            latest = data_store.get_spread_set(match)
+            latest.set_latest_idx(idx)
+            latest.add_latest_stats(list(LATEST_STATS))
+
+            assert not latest.get_stats()
+
+            for stat in LATEST_STATS:
+                value = rows[idx][spread_set_row[stat]]
+                assert latest.get_latest()[spread_set_row[stat]] == value
+                checked += value is not None
+
+    assert checked > 0
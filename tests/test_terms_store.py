@@ -0,0 +1,34 @@
+from conftest import get_live_sets
+from data.data_store import data_row
+from data.domain import MONTH_I2A
+from data.spread_set import spread_set_row
+
+
+# a sequence row's days_listed is the least of its legs' on that date.
+# plot_ids name each row's legs, e.g. ( "+G10", "-J10" ).
+def test_days_listed_is_min_over_legs(get_store, engine):
+    data_store = get_store("sequence", engine)
+    columns = data_store.get_columns()
+    days_listed = {
+        ( MONTH_I2A[month], year % 100, day ): dl
+        for month, year, day, dl in zip(
+            columns[data_row.month].tolist(),
+            columns[data_row.year].tolist(),
+            columns[data_row.date].tolist(),
+            columns[data_row.days_listed].tolist()
+        )
+    }
+    checked = 0
+
+    for _, spread_set in get_live_sets(data_store, "sequence"):
+        for row in spread_set.get_rows():
+            legs = [
+                days_listed[( leg[1], int(leg[2:]), row[spread_set_row.date] )]
+                for leg in row[spread_set_row.plot_id]
+            ]
+
+            assert row[spread_set_row.days_listed] == min(legs)
+            checked += len(set(legs)) > 1
+
+    # some rows' legs were listed for different days
+    assert checked > 0
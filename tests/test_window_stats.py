@@ -0,0 +1,46 @@
+from numpy import array
+from numpy.random import default_rng
+from window_stats import avg, avg_series, cov, cov_series, var, var_series
+
+
+WIN_LEN = 30
+LENGTH = 200
+
+
+def get_series(seed):
+    rng = default_rng(seed)
+
+    return rng.normal(50, 5, LENGTH).tolist(), rng.normal(0, 1, LENGTH).tolist()
+
+
+# next() given all of x drops x[-1] when the window first fills
+def test_var_avg_series():
+    x, _ = get_series(1)
+    x_var = var(WIN_LEN)
+    x_avg = avg(WIN_LEN)
+
+    assert var_series(array(x), WIN_LEN, x[-1]).tolist() == [
+        x_var.next(x, i) for i in range(LENGTH)
+    ]
+    assert avg_series(array(x), WIN_LEN, x[-1]).tolist() == [
+        x_avg.next(x, i) for i in range(LENGTH)
+    ]
+
+
+# next() given lists that grow by one element per call, as r_2() calls
+# it, drops x[WIN_LEN - 1]; skipped calls add nothing
+def test_cov_series_skipped():
+    x, y = get_series(2)
+    called = default_rng(3).random(LENGTH) > 0.2
+    xy_cov = cov(WIN_LEN)
+    expected = []
+
+    for i in range(LENGTH):
+        if called[i]:
+            expected.append(xy_cov.next(x[:i + 1], y[:i + 1], i))
+
+    series = cov_series(
+        array(x), array(y), WIN_LEN, x[WIN_LEN - 1], y[WIN_LEN - 1], called
+    )
+
+    assert series[called].tolist() == expected
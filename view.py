@@ -5,14 +5,18 @@ from dash_core_components import \
     Dropdown, Graph, Input as CInput, Textarea
 from dash_html_components import \
     Div, Table, Tr, Td, Button
+from data.cache import data_cache
+from data.db import get_pool
 from data.spread_set import spread_set_index
 from datetime import date, timedelta
 from json import loads, dumps
 from numpy import array
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from profiling import \
+    get_env_options, get_options, make_options, profiled, set_options
 from scan import scan
-from sqlite3 import connect
+from signal import SIGUSR1, signal
 
 
 # GLOBAL VARIABLES
@@ -20,6 +24,7 @@ from sqlite3 import connect
 config = None
 app = Dash(__name__)
 current_scan = None
+current_store = None
 scan_defs = {}
 match_data = {}
 figures = {}
@@ -38,7 +43,7 @@ def stat_subplot(fig, spread_set, plot_def, x_lim):
     color = plot_def[1]
     row_num = plot_def[2]
 
-    rows = spread_set.get_stat(stat)["rows"]
+    rows = spread_set.get_stat_rows(stat)
 
     # stat trace
     fig.add_trace(
@@ -116,7 +121,7 @@ def create_graph(spread_set, stats):
     window = date.today() - timedelta(days= 5)
 
     for plot_id, spread in spreads.items():
-        latest = date.fromisoformat(spread[-1][i_dt])
+        latest = date.fromordinal(spread[-1][i_dt])
         active = window <= latest
 
         if active:
@@ -323,23 +328,27 @@ def update_current_scan(
 )
 def execute_current_scan(start):
     # clear previous results
-    global match_data
+    global match_data, current_store
     match_data = {}
     
-    # execute current_scan, store results
-    db = connect(config["db_path"])
-    response = scan(current_scan, db).execute()
+    # execute current_scan, store results and the store to rebuild
+    # their spread sets from
+    db = get_pool(config["db_path"])
+    cache = data_cache(config["cache_dir"]) if "cache_dir" in config else None
+    s = scan(current_scan, db, cache)
+
+    with profiled(s.get_name()):
+        response = s.execute()
+
+    current_store = s.get_data_store()
     
     matches = []
 
     for result in response["results"]:
-        match = str(result["match"])
-        spread_set = result["data"]
-        match_data[match] = spread_set
+        match = str(result.get_match())
+        match_data[match] = result
         matches.append(match)
 
-    db.close()
-
     # populate matches textarea for user editing
     return "\n".join(matches)
 
@@ -415,7 +424,7 @@ def generate_graphs(generate_graphs, matches):
     # generate, store figures and set viewing options
     for match in matches.split("\n"):
         if match in match_data:
-            spread_set = match_data[match]
+            spread_set = match_data[match].get_data(current_store)
             figures[match] = create_graph(spread_set, stats)
             viewing_options.append(
                 {
@@ -437,6 +446,16 @@ def update_graph(viewing):
     return figures[viewing]
 
 
+# SIGUSR1 turns profiling of execute_current_scan on or off, e.g. 
+# "kill -USR1 <pid>" on a live box. when on, it uses SCAN_PROFILE's
+# settings if set, else every profiler.
+def toggle_profiling(signum, frame):
+    if get_options():
+        set_options(None)
+    else:
+        set_options(get_env_options() or make_options("cpu,mem"))
+
+
 def get_layout(scans):
     return Table([
         Tr([
@@ -515,6 +534,9 @@ def get_layout(scans):
 
 
 if __name__=="__main__":
+    set_options(get_env_options())
+    signal(SIGUSR1, toggle_profiling)
+
     with open('./config.json') as fd:
         config = loads(fd.read())
 
@@ -1,8 +1,6 @@
-from numpy import std, cov as npcov
-from numpy.random import randn
-from statistics import stdev
+from itertools import repeat
 from math import sqrt, pow
-from matplotlib import pyplot as plt
+from numpy import arange, empty, fromiter, minimum, zeros
 
 
 class var:
@@ -135,7 +133,88 @@ class cov:
         return (self.xy - (self.x * self.y) / n) / n
 
 
+# whole-array versions of the classes' next(): element i is what 
+# next(x, i) returns once it has been called for 0, ..., i. the 
+# running sums are cumulative sums over the same additions and 
+# subtractions, in the same order, and squares are taken with pow(),
+# as next() takes them, so the results agree with the classes to the
+# last bit, even where their sums cancel, in O(n) array operations.
+#   - last:     what next() drops at i = win_len - 1, where n first
+#               equals win_len and x[i - n] is x[-1]: x's last element
+#               if next() is given all of x, or x[win_len - 1] if x 
+#               grows by one element per call
+#   - called:   bool per i, False where the caller skipped next()
+
+
+def squares(x):
+    return fromiter(
+        map(pow, x.tolist(), repeat(2)), dtype = float, count = len(x)
+    )
+
+
+# what next() subtracts from its sums at each i
+def dropped(x, win_len, last):
+    out = zeros(len(x))
+
+    if len(x) >= win_len:
+        out[win_len - 1] = last
+        out[win_len:] = x[:len(x) - win_len]
+
+    return out
+
+
+# sums of added less dropped after each i, subtracting first as next()
+# does. skipped steps add nothing.
+def running_sums(added, dropped, called = None):
+    steps = empty(( len(added), 2 ))
+    steps[:, 0] = -dropped
+    steps[:, 1] = added
+
+    if called is not None:
+        steps[~called] = 0
+
+    return steps.ravel().cumsum()[1::2]
+
+
+def window_len(num, win_len):
+    return minimum(arange(1, num + 1), win_len)
+
+
+def var_series(x, win_len, last):
+    n = window_len(len(x), win_len)
+    x_sq = squares(x)
+    x_sum = running_sums(x, dropped(x, win_len, last))
+    x_sum_sq = running_sums(x_sq, dropped(x_sq, win_len, pow(last, 2)))
+    out = (x_sum_sq - squares(x_sum) / n) / n
+    out[n == 1] = 0
+
+    return out
+
+
+def avg_series(x, win_len, last):
+    return running_sums(x, dropped(x, win_len, last)) / \
+           window_len(len(x), win_len)
+
+
+def cov_series(x, y, win_len, last_x, last_y, called = None):
+    n = window_len(len(x), win_len)
+    x_0 = dropped(x, win_len, last_x)
+    y_0 = dropped(y, win_len, last_y)
+    sum_x = running_sums(x, x_0, called)
+    sum_y = running_sums(y, y_0, called)
+    sum_xy = running_sums(x * y, x_0 * y_0, called)
+
+    return (sum_xy - (sum_x * sum_y) / n) / n
+
+
+# the demo's imports are kept here, so importing this module, e.g. 
+# from spread_set, doesn't load matplotlib
 if __name__ == "__main__":
+    from matplotlib import pyplot as plt
+    from numpy import array, std, cov as npcov
+    from numpy.random import randn
+    from statistics import stdev
+
     mode = "cov"
     win_len = 30
 
@@ -147,7 +226,7 @@ if __name__ == "__main__":
 
         wv = var(win_len)
 
-        t0 = [ sqrt(wv.next_(x, i)) for i in range(len(x)) ]
+        t0 = var_series(array(x), win_len, x[-1]) ** 0.5
         t1 = [ sqrt(wv.next(x, i)) for i in range(len(x)) ]
         t2 = [ stdev(x[max(0, i - win_len):i]) for i in range(2, len(x)) ]
         t3 = [ std(x[max(0, i - win_len):i]) for i in range(2, len(x)) ]
@@ -191,6 +270,6 @@ if __name__ == "__main__":
         fix, (ax0, ax1) = plt.subplots(2)
         
         ax0.plot(x_, t0[win_len:])
-        ax1.plot(x_, t0[win_len:])
+        ax1.plot(x_, t1[win_len:])
         
         plt.show()
\ No newline at end of file